@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ListenapiConfig(AppConfig):
     name = 'listenapi'
+
+    def ready(self):
+        # Connect the signal receivers
+        from listenapi import database, signals  # noqa: F401
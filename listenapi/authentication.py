@@ -0,0 +1,103 @@
+"""Token authentication backed by an in-process cache"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Bounded LRU of token key -> Token, whose entries expire after `ttl` seconds
+
+    The cached Token carries its user, and the user its musician, so
+    `request.auth.user` and `request.user.musician` cost no queries. The
+    instances are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            token, expires = entry
+            if expires < time.monotonic():
+                self._discard(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (token, time.monotonic() + self.ttl)
+            self._keys_by_user[token.user_id] = key
+
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def forget_token(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def forget_user(self, user_id):
+        with self._lock:
+            key = self._keys_by_user.get(user_id)
+            if key is not None:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and self._keys_by_user.get(entry[0].user_id) == key:
+            del self._keys_by_user[entry[0].user_id]
+
+
+token_cache = TokenCache(
+    maxsize=getattr(settings, 'TOKEN_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 300)
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the Token/User/Musician queries on a cache hit
+
+    Entries are dropped by the receivers in listenapi.signals when a token,
+    user or musician is saved or deleted in this process; the TTL bounds how
+    long other processes can keep serving a stale entry.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user__musician').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+
+            # Resolve the reverse one-to-one now so a user without a
+            # musician profile is cached as such rather than re-queried
+            if not hasattr(token.user, 'musician'):
+                token.user.musician = None
+
+            token_cache.set(key, token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        return (token.user, token)
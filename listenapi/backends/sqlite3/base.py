@@ -0,0 +1,31 @@
+"""Django's SQLite backend, with the transaction_mode option of Django 5.1
+
+A transaction that begins with a plain (deferred) BEGIN takes the write
+lock only at its first write. If another connection has committed since
+the transaction's first read, SQLite cannot upgrade the lock and fails at
+once with "database is locked", without waiting out busy_timeout.
+OPTIONS['transaction_mode'] = 'IMMEDIATE' takes the write lock at BEGIN,
+where busy_timeout applies, so concurrent writers queue instead.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED').upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f'transaction_mode must be one of {", ".join(TRANSACTION_MODES)}')
+        return mode
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('transaction_mode', None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
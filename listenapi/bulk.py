@@ -0,0 +1,87 @@
+"""Creating many rows in one request
+
+A bulk endpoint takes a JSON array of the objects its single-item create
+takes. The related rows of every item are fetched up front with one
+`in_bulk` query per model. Each item is then checked on its own. The valid
+ones are written with one multi-row INSERT per table, in one transaction,
+and the invalid ones are reported back by their position in the array.
+
+`bulk_create` sends no signals, so `listenapi.signals.created_in_bulk`
+does what the post_save receivers would have done for the new rows.
+"""
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import ParseError
+
+
+class ItemError(Exception):
+    """One item of a bulk request cannot be created"""
+
+
+def max_items():
+    return getattr(settings, 'BULK_MAX_ITEMS', 100)
+
+
+def items_of(request):
+    """The array of items in a bulk request's body"""
+    items = request.data
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ParseError('Expected a JSON array of objects')
+    if len(items) > max_items():
+        raise ParseError(f'At most {max_items()} items can be created at once')
+    return items
+
+
+def ids_of(items, key, kind=int):
+    """Every well-formed id in `items` under `key`, to fetch with `in_bulk`"""
+    ids = set()
+    for item in items:
+        try:
+            ids.add(kind(item[key]))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            pass
+    return ids
+
+
+def field(item, key):
+    """A required value of an item"""
+    try:
+        return item[key]
+    except KeyError:
+        raise ItemError(f'Missing {key}')
+
+
+def related(item, key, rows, kind=int):
+    """The row, out of `rows` from `in_bulk`, that an item refers to under `key`"""
+    value = field(item, key)
+    try:
+        return rows[kind(value)]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ItemError(f'No {key} {value!r}')
+
+
+def insert(model, instances):
+    """bulk_create `instances` and give each its primary key
+
+    Must run inside a transaction. PostgreSQL returns the new keys from the
+    INSERT itself. SQLite cannot, but it holds the write lock until the
+    transaction ends and numbers new rows upwards from the highest key. The
+    new rows are therefore the `len(instances)` highest keys, in order.
+    """
+    model.objects.bulk_create(instances)
+    if instances and not connection.features.can_return_rows_from_bulk_insert:
+        last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+        for pk, instance in zip(range(last - len(instances) + 1, last + 1), instances):
+            instance.pk = pk
+    return instances
+
+
+def results(entries, name, render):
+    """Per-item outcome, in request order, for `entries` of instances and ItemErrors"""
+    outcome = []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, ItemError):
+            outcome.append({'index': index, 'status': 400, 'message': entry.args[0]})
+        else:
+            outcome.append({'index': index, 'status': 201, name: render(entry)})
+    return outcome
@@ -0,0 +1,146 @@
+"""Counts of the comments, goals and recordings under recordings and excerpts
+
+Recording keeps comment_count and goal_count. Excerpt keeps recording_count
+and goal_count, which counts the goals on all of its recordings. Cards can
+then show the counts without fetching the lists.
+
+The receivers in listenapi.signals note which parents a row counts towards
+before it is saved or deleted, and look again afterwards. Only a row that
+was created, deleted or moved changes any count, each with an F() update.
+The receivers run inside the write's transaction and lock the row while
+they read it, so of two concurrent deletes or moves of one row only the
+first changes the counts; the second finds it gone or already moved. A
+count is never taken below zero.
+A recording carries its goals with it when it moves to another excerpt or
+is deleted. The bulk create paths count their rows with one query. Other
+writes that bypass signals, like queryset .update(), are not counted, and
+`manage.py reconcile_counts` corrects them.
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from listenapi.models import Comment, Excerpt, Goal, Recording
+from listenapi.response_cache import invalidate
+from listenapi.versions import bump
+
+# model: [(lookup of a parent's id on the row, parent, its count column, what the row adds to it)]
+COUNTED = {
+    Comment: [('recording_id', Recording, 'comment_count', 1)],
+    Goal: [('recording_id', Recording, 'goal_count', 1),
+           ('recording__excerpt_id', Excerpt, 'goal_count', 1)],
+    Recording: [('excerpt_id', Excerpt, 'recording_count', 1),
+                ('excerpt_id', Excerpt, 'goal_count', 'goal_count')],
+}
+
+# parent: {count column: (model counted, lookup of the parent's id on it)}
+SOURCES = {
+    Recording: {'comment_count': (Comment, 'recording_id'), 'goal_count': (Goal, 'recording_id')},
+    Excerpt: {'recording_count': (Recording, 'excerpt_id'), 'goal_count': (Goal, 'recording__excerpt_id')},
+}
+
+# parent: lookup of the musician whose cached lists show it
+MUSICIAN_OF = {Recording: 'excerpt__musician_id', Excerpt: 'musician_id'}
+
+
+def columns(model):
+    """Columns to read for the parents of `model` rows, each once"""
+    names = [lookup for lookup, _, _, _ in COUNTED[model]]
+    names += [amount for _, _, _, amount in COUNTED[model] if isinstance(amount, str)]
+    return list(dict.fromkeys(names))
+
+
+def tallies(model, row):
+    """[(parent id, amount)] a row read with `columns` adds, in COUNTED order"""
+    values = dict(zip(columns(model), row))
+    return [(values[lookup], values[amount] if isinstance(amount, str) else amount)
+            for lookup, _, _, amount in COUNTED[model]]
+
+
+def state(model, pk):
+    """What a stored row adds to which parents; nothing for a row not yet stored
+
+    Inside a transaction the row stays locked until it ends.
+    """
+    rows = model.objects.filter(pk=pk)
+    if transaction.get_connection().in_atomic_block:
+        rows = rows.select_for_update()
+    row = rows.values_list(*columns(model)).first() if pk else None
+    if row is None:
+        return [(None, 0)] * len(COUNTED[model])
+    return tallies(model, row)
+
+
+def add(parent, column, parent_id, amount):
+    change = F(column) + amount if amount > 0 else Greatest(F(column) + amount, 0)
+    parent.objects.filter(pk=parent_id).update(**{column: change})
+
+
+def moved(model, before, after):
+    """Move a row's share of the counts from the parents in `before` to those in `after`"""
+    changed = {}
+    for (_, parent, column, _), old, new in zip(COUNTED[model], before, after):
+        if old == new:
+            continue
+        for (parent_id, amount), sign in ((old, -1), (new, 1)):
+            if parent_id is not None and amount:
+                add(parent, column, parent_id, sign * amount)
+                changed.setdefault(parent, set()).add(parent_id)
+    published(changed)
+
+
+def created_in_bulk(model, ids):
+    """Count rows made with bulk_create, one query and one update per parent"""
+    totals = Counter()
+    for row in model.objects.filter(pk__in=ids).values_list(*columns(model)):
+        for (_, parent, column, _), (parent_id, amount) in zip(COUNTED[model], tallies(model, row)):
+            if parent_id is not None:
+                totals[parent, column, parent_id] += amount
+
+    changed = {}
+    for (parent, column, parent_id), amount in totals.items():
+        if amount:
+            add(parent, column, parent_id, amount)
+            changed.setdefault(parent, set()).add(parent_id)
+    published(changed)
+
+
+def published(changed):
+    """Make the new counts of `changed` ({parent: ids}) visible to cached and conditional GETs"""
+    if not changed:
+        return
+    # .update() sends no signals
+    bump(*changed)
+    musicians = set()
+    for parent, ids in changed.items():
+        musicians.update(parent.objects.filter(pk__in=ids).values_list(MUSICIAN_OF[parent], flat=True))
+    invalidate(*(('musician', musician_id) for musician_id in musicians))
+
+
+def actual(parent):
+    """Each count column of `parent` as an expression counting the rows now"""
+    expressions = {}
+    for column, (model, lookup) in SOURCES[parent].items():
+        rows = model.objects.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup)
+        expressions[column] = Coalesce(
+            Subquery(rows.annotate(count=Count('pk')).values('count'), output_field=IntegerField()), 0
+        )
+    return expressions
+
+
+def reconcile():
+    """Recount every parent's columns; returns {parent: how many rows were wrong}"""
+    wrong = {}
+    for parent in SOURCES:
+        expressions = actual(parent)
+        stale = Q()
+        for column in expressions:
+            stale |= ~Q(**{column: F('actual_' + column)})
+        ids = list(parent.objects.annotate(
+            **{'actual_' + column: expression for column, expression in expressions.items()}
+        ).filter(stale).values_list('pk', flat=True))
+        if ids:
+            parent.objects.filter(pk__in=ids).update(**expressions)
+            published({parent: set(ids)})
+        wrong[parent] = len(ids)
+    return wrong
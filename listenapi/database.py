@@ -0,0 +1,44 @@
+"""Setup of database connections as they are opened and reused
+
+Every new SQLite connection gets settings.SQLITE_PRAGMAS, which put the file
+in write-ahead-log mode, so requests reading the database no longer block
+the one writing it, nor the writer them. They also make a writer wait up to
+busy_timeout milliseconds for the write lock rather than fail at once with
+"database is locked". The journal mode is stored in the file, but the other
+pragmas last only as long as the connection, so each one is set again.
+
+With CONN_MAX_AGE a connection outlives its request. Django 4.1 and later
+check such a connection before a request reuses it when CONN_HEALTH_CHECKS
+is set. On earlier releases, which ignore the setting, the receiver below
+does the same, so a database restart costs one reconnect rather than an
+error on every worker's next request.
+"""
+import django
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to a new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def check_reused_connections(sender, **kwargs):
+    """Close a kept-open connection that no longer works, so the request opens a fresh one"""
+    for connection in connections.all():
+        if connection.connection is None or not connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+if django.VERSION < (4, 1):
+    request_started.connect(check_reused_connections)
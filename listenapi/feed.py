@@ -0,0 +1,82 @@
+"""Fan-out-on-write maintenance of follower timelines
+
+Every recording and comment a musician makes is copied, as a FeedEntry, onto
+the timeline of each musician actively following them. Reading a feed is
+then a single range scan of the follower's own entries. The copying runs in
+background jobs (listenapi.tasks), so a timeline catches up shortly after a
+post or a follow rather than during the request. A recording that moves to
+another musician, itself or with its excerpt, is fanned out again.
+"""
+from django.db import transaction
+from listenapi.models import Comment, Connection, FeedEntry, Recording
+from listenapi.versions import bump
+
+
+def followers_of(musician_id):
+    """Ids of the musicians actively following `musician_id`"""
+    return Connection.objects.filter(
+        practicer_id=musician_id, ended_on=None
+    ).values_list('follower_id', flat=True).distinct()
+
+
+def fan_out_recording(recording):
+    """Put a recording on its musician's followers' timelines, and only theirs"""
+    musician_id = recording.excerpt.musician_id if recording.excerpt else None
+    followers = followers_of(musician_id) if musician_id is not None else []
+
+    # replace rather than add, so running the job again is harmless and a
+    # recording that changed musician leaves the old followers' timelines
+    with transaction.atomic():
+        FeedEntry.objects.filter(recording_id=recording.id).delete()
+        FeedEntry.objects.bulk_create([
+            FeedEntry(follower_id=follower_id, musician_id=musician_id,
+                      recording_id=recording.id, date=recording.date)
+            for follower_id in followers
+        ])
+        bump(FeedEntry)
+
+
+def fan_out_comment(comment):
+    """Put a new comment on its author's followers' timelines"""
+    if comment.author_id is None:
+        return
+
+    with transaction.atomic():
+        FeedEntry.objects.filter(comment_id=comment.id).delete()
+        FeedEntry.objects.bulk_create([
+            FeedEntry(follower_id=follower_id, musician_id=comment.author_id,
+                      comment_id=comment.id, date=comment.date)
+            for follower_id in followers_of(comment.author_id)
+        ])
+        bump(FeedEntry)
+
+
+def rebuild_timeline(follower_id):
+    """Recompute a follower's whole timeline from their active connections"""
+    following = Connection.objects.filter(
+        follower_id=follower_id, ended_on=None
+    ).values_list('practicer_id', flat=True)
+
+    recordings = Recording.objects.filter(
+        excerpt__musician_id__in=following
+    ).values_list('id', 'excerpt__musician_id', 'date')
+
+    comments = Comment.objects.filter(
+        author_id__in=following
+    ).values_list('id', 'author_id', 'date')
+
+    with transaction.atomic():
+        FeedEntry.objects.filter(follower_id=follower_id).delete()
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(follower_id=follower_id, musician_id=musician_id,
+                          recording_id=recording_id, date=day)
+                for recording_id, musician_id, day in recordings.iterator()
+            ] + [
+                FeedEntry(follower_id=follower_id, musician_id=musician_id,
+                          comment_id=comment_id, date=day)
+                for comment_id, musician_id, day in comments.iterator()
+            ],
+            batch_size=500
+        )
+        bump(FeedEntry)
@@ -0,0 +1,125 @@
+"""The follow graph: denormalized counts and friend-of-friend suggestions
+
+A connection is active until it has an ended_on date. Musician keeps
+follower_count and following_count of its active connections. The
+receivers in listenapi.signals adjust both ends with F() updates whenever a
+connection starts, ends or is deleted. Profiles then show the counts
+without counting rows.
+
+Suggestions for a musician are the musicians followed by the musicians
+they follow, ranked by how many of those follow each one. Only the
+SUGGESTION_SOURCES most recently followed musicians are considered, so the
+cost has a fixed bound. The ranked ids are cached per musician for
+SUGGESTION_TIMEOUT seconds, and dropped as soon as the musician follows or
+unfollows anyone. Deleting a musician detaches their connections without
+signals, so a pre_delete receiver takes them off the counts first.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Count, Exists, F, OuterRef, Q, Value
+from listenapi.authentication import token_cache
+from listenapi.models import Connection, Musician
+from listenapi.versions import bump
+
+
+def viewer_follows(request):
+    """Annotation on musicians: whether the viewer actively follows each one"""
+    musician = getattr(request.user, 'musician', None)
+    if musician is None:
+        return Value(False, output_field=BooleanField())
+    return Exists(Connection.objects.filter(practicer_id=OuterRef('pk'), follower_id=musician.id, ended_on=None))
+
+
+def active_pair(connection):
+    """(practicer id, follower id) of an active connection, else None"""
+    if connection is None or connection.ended_on is not None:
+        return None
+    if connection.practicer_id is None or connection.follower_id is None:
+        return None
+    return connection.practicer_id, connection.follower_id
+
+
+def count(pair, step):
+    """Add `step` to the counts at both ends of an active connection"""
+    practicer_id, follower_id = pair
+    Musician.objects.filter(pk=practicer_id).update(follower_count=F('follower_count') + step)
+    Musician.objects.filter(pk=follower_id).update(following_count=F('following_count') + step)
+    # .update() sends no signals; profiles show the counts
+    bump(Musician)
+    for user_id in Musician.objects.filter(pk__in=pair).values_list('user_id', flat=True):
+        token_cache.forget_user(user_id)
+
+
+def connection_changed(before, after):
+    """Keep the counts right as a connection goes from `before` to `after` (pairs or None)"""
+    if before == after:
+        return
+    if before is not None:
+        count(before, -1)
+        forget_suggestions(before[1])
+    if after is not None:
+        count(after, 1)
+        forget_suggestions(after[1])
+
+
+def musician_deleted(musician_id):
+    """Take a deleted musician's active connections off the counts at their other ends"""
+    active = Connection.objects.filter(ended_on=None, practicer__isnull=False, follower__isnull=False)
+    for pair in active.filter(Q(practicer_id=musician_id) | Q(follower_id=musician_id)).values_list(
+            'practicer_id', 'follower_id'):
+        connection_changed(pair, None)
+
+
+def recount():
+    """Recompute every musician's counts from the connections; returns how many were wrong"""
+    active = Connection.objects.filter(ended_on=None, practicer__isnull=False, follower__isnull=False)
+    followers = dict(active.values_list('practicer_id').annotate(count=Count('id')).order_by())
+    following = dict(active.values_list('follower_id').annotate(count=Count('id')).order_by())
+
+    wrong = 0
+    for musician_id, follower_count, following_count in Musician.objects.values_list(
+            'id', 'follower_count', 'following_count').iterator():
+        right = (followers.get(musician_id, 0), following.get(musician_id, 0))
+        if (follower_count, following_count) != right:
+            Musician.objects.filter(pk=musician_id).update(follower_count=right[0], following_count=right[1])
+            wrong += 1
+    if wrong:
+        bump(Musician)
+        token_cache.clear()
+    return wrong
+
+
+def suggestions_key(musician_id):
+    return f'suggestions:{musician_id}'
+
+
+def forget_suggestions(musician_id):
+    cache.delete(suggestions_key(musician_id))
+
+
+def suggestions(musician_id):
+    """[(musician id, how many followed musicians follow them)], best first"""
+    key = suggestions_key(musician_id)
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = rank_suggestions(musician_id)
+        cache.set(key, ranked, getattr(settings, 'SUGGESTION_TIMEOUT', 3600))
+    return ranked
+
+
+def rank_suggestions(musician_id):
+    followed = Connection.objects.filter(follower_id=musician_id, ended_on=None)
+    # the most recent follows stand for the whole list, bounding the fan-out
+    sources = followed.order_by('-id').values('practicer_id')[:getattr(settings, 'SUGGESTION_SOURCES', 200)]
+
+    candidates = Connection.objects.filter(
+        follower_id__in=sources, ended_on=None, practicer__isnull=False
+    ).exclude(
+        practicer_id=musician_id
+    ).exclude(
+        practicer_id__in=followed.values('practicer_id')
+    ).values('practicer_id').annotate(
+        mutual=Count('follower_id', distinct=True)
+    ).order_by('-mutual', 'practicer_id')
+
+    return list(candidates.values_list('practicer_id', 'mutual')[:getattr(settings, 'SUGGESTION_LIMIT', 10)])
@@ -0,0 +1,112 @@
+"""Background jobs kept in the database and run by `manage.py runworker`
+
+A job is a call of a module-level function, by dotted path, with
+JSON-serializable arguments. `enqueue` writes the Job row in the caller's
+transaction. A worker therefore only sees the job once the data it refers
+to has been committed, and never sees it if that transaction rolls back.
+
+Delivery is at least once. A worker claims a job by taking a lease on it
+with a conditional UPDATE, so two workers never claim the same job at once.
+If the worker dies before the job finishes, the lease expires and the job is
+claimed again. Job functions must therefore be safe to run more than once.
+A failing job is retried with exponential backoff until it has had
+max_attempts tries. After that it is kept with status 'failed' and its last
+traceback. A job that succeeds is deleted. A worker whose lease expired may
+find the job already finished and deleted by the worker that took it over;
+it then leaves it alone.
+"""
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from listenapi.models import Job
+
+
+def enqueue(name, *args, delay=0):
+    """Queue a call of the function at dotted path `name` with `args`, after `delay` seconds"""
+    return Job.objects.create(
+        name=name,
+        args=list(args),
+        max_attempts=getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+        run_after=timezone.now() + timedelta(seconds=delay)
+    )
+
+
+def enqueue_many(name, arg_lists):
+    """Queue one call of `name` per entry of `arg_lists` with a single INSERT"""
+    run_after = timezone.now()
+    return Job.objects.bulk_create(
+        Job(name=name, args=list(args), max_attempts=getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+            run_after=run_after)
+        for args in arg_lists
+    )
+
+
+def claim(limit):
+    """Lease up to `limit` due jobs to this worker and return their ids"""
+    now = timezone.now()
+    due = Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+    lease = timedelta(seconds=getattr(settings, 'JOB_LEASE', 600))
+
+    claimed = []
+    for job_id in Job.objects.filter(due).order_by('run_after').values_list('id', flat=True)[:limit]:
+        # another worker may have taken it since the SELECT; the UPDATE only
+        # matches if the job is still due
+        if Job.objects.filter(due, pk=job_id).update(
+                status=Job.RUNNING, locked_until=now + lease, attempts=F('attempts') + 1):
+            claimed.append(job_id)
+    return claimed
+
+
+def execute(job_id):
+    """Run a claimed job, then delete it or schedule its retry"""
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        # finished by a worker that took over after our lease expired
+        return
+    try:
+        import_string(job.name)(*job.args)
+    except Exception:
+        retry(job_id, traceback.format_exc())
+    else:
+        Job.objects.filter(pk=job_id, status=Job.RUNNING).delete()
+
+
+def retry(job_id, error):
+    """Record a failed attempt: back off and queue the job again, or give up on it"""
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        return
+    now = timezone.now()
+
+    if job.attempts >= job.max_attempts:
+        Job.objects.filter(pk=job_id).update(
+            status=Job.FAILED, locked_until=None, last_error=error, finished_on=now)
+    else:
+        Job.objects.filter(pk=job_id).update(
+            status=Job.QUEUED, locked_until=None, last_error=error,
+            run_after=now + timedelta(seconds=backoff(job.attempts)))
+
+
+def backoff(attempts):
+    """Seconds to wait before the try after attempt number `attempts`"""
+    delay = getattr(settings, 'JOB_RETRY_DELAY', 10) * 2 ** (attempts - 1)
+    return min(delay, getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600))
+
+
+def run_pending():
+    """Run every due job in this process until none are left, and return how many ran
+
+    For tests and one-off scripts; a retried job is not due again until
+    its backoff has passed, so this always returns.
+    """
+    ran = 0
+    while True:
+        claimed = claim(100)
+        if not claimed:
+            return ran
+        for job_id in claimed:
+            execute(job_id)
+            ran += 1
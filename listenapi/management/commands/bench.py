@@ -0,0 +1,328 @@
+"""Benchmarks run against a throwaway copy of the test database"""
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(latencies, fraction):
+    """The latency below which `fraction` of the samples fall"""
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def check(response, latency):
+    """Fail the benchmark on an error response rather than timing it"""
+    if response.status_code >= 400:
+        raise CommandError(f'{response.status_code} from {response.request["PATH_INFO"]}')
+    return latency
+
+
+def steps(request):
+    """A request is (method, path, body), or a list of them sent one after another and timed together"""
+    return request if isinstance(request, list) else [request]
+
+
+def asgi_headers(headers):
+    """AsyncClient takes header names (authorization), not the WSGI keys (HTTP_AUTHORIZATION)"""
+    return {name[len('HTTP_'):].replace('_', '-').lower(): value for name, value in headers.items()}
+
+
+def run_wsgi(requests, workers, judge=check, **headers):
+    """Send `requests` through the WSGI handler from `workers` threads
+
+    Each thread stands in for one synchronous worker: it is busy for the
+    whole of every request it serves. `judge` turns each response into its
+    latency.
+    """
+    def send(request):
+        client = Client(raise_request_exception=False, **headers)
+        started = time.perf_counter()
+        for method, path, body in steps(request):
+            response = getattr(client, method)(path, body, content_type='application/json')
+            latency = judge(response, time.perf_counter() - started)
+        return latency
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(send, requests))
+    return time.perf_counter() - started, latencies
+
+
+def run_asgi(requests, clients, **headers):
+    """Send `requests` through the ASGI handler with `clients` in flight at once"""
+    async def main():
+        client = AsyncClient()
+        in_flight = asyncio.Semaphore(clients)
+
+        async def send(request):
+            async with in_flight:
+                started = time.perf_counter()
+                for method, path, body in steps(request):
+                    response = await getattr(client, method)(path, body, content_type='application/json',
+                                                             **asgi_headers(headers))
+                    latency = check(response, time.perf_counter() - started)
+                return latency
+
+        return await asyncio.gather(*(send(request) for request in requests))
+
+    started = time.perf_counter()
+    latencies = asyncio.run(main())
+    return time.perf_counter() - started, latencies
+
+
+def bench_login(command, options):
+    """POST /login: blocking WSGI workers against the async view under ASGI"""
+    from listenapi.views.auth import create_musician, make_password
+
+    create_musician({
+        'username': 'benchviolin', 'email': 'bench@example.com', 'bio': '',
+        'first_name': 'Bench', 'last_name': 'Mark'
+    }, make_password('practice-every-day'))
+
+    body = json.dumps({'username': 'benchviolin', 'password': 'practice-every-day'})
+    requests = [('post', '/login', body)] * options['requests']
+
+    command.report('WSGI', options['clients'], *run_wsgi(requests, options['clients']))
+    command.report('ASGI', options['clients'], *run_asgi(requests, options['clients']))
+
+
+def bench_serializers(command, options):
+    """Render a list of recordings with nested ModelSerializers and with the shared projection"""
+    from datetime import date, timedelta
+    from django.contrib.auth.models import User
+    from rest_framework import serializers
+    from rest_framework.renderers import JSONRenderer
+    from listenapi.models import Excerpt, Musician, Recording
+    from listenapi.serializers import RECORDING
+
+    # The per-view serializers /recordings used before listenapi.serializers
+    class UserSerializer(serializers.ModelSerializer):
+        class Meta:
+            model = User
+            fields = ('first_name', 'last_name', 'email')
+
+    class MusicianSerializer(serializers.ModelSerializer):
+        user = UserSerializer(many=False)
+        class Meta:
+            model = Musician
+            fields = ('id', 'bio', 'user')
+
+    class ExcerptSerializer(serializers.ModelSerializer):
+        musician = MusicianSerializer(many=False)
+        class Meta:
+            model = Excerpt
+            fields = ('id', 'name', 'musician')
+
+    class RecordingSerializer(serializers.ModelSerializer):
+        excerpt = ExcerptSerializer(many=False)
+        class Meta:
+            model = Recording
+            fields = ('id', 'audio', 'excerpt', 'date', 'label', 'duration', 'sample_rate', 'channels',
+                      'comment_count', 'goal_count')
+            depth = 2
+
+    excerpts = []
+    for number in range(10):
+        user = User.objects.create(username=f'bench{number}', first_name='Bench', last_name=str(number))
+        musician = Musician.objects.create(user=user, bio='violinist')
+        excerpts.append(Excerpt.objects.create(name=f'Excerpt {number}', musician=musician))
+
+    start = date(2020, 12, 1)
+    Recording.objects.bulk_create(
+        Recording(excerpt=excerpts[index % len(excerpts)], audio=f'take{index}.wav',
+                  date=start + timedelta(days=index % 365), label=f'take {index}')
+        for index in range(options['rows'])
+    )
+
+    recordings = Recording.objects.order_by('-id')
+    renderer = JSONRenderer()
+
+    def drf():
+        rows = recordings.select_related('excerpt__musician__user')
+        return renderer.render(RecordingSerializer(rows, many=True).data)
+
+    def projection():
+        return renderer.render(RECORDING.render_many(RECORDING.values(recordings)))
+
+    if drf() != projection():
+        raise CommandError('The projection does not render the same JSON as the serializers')
+
+    for label, render in (('DRF', drf), ('values', projection)):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            began = time.perf_counter()
+            render()
+            latencies.append(time.perf_counter() - began)
+        command.report(label, 1, time.perf_counter() - started, latencies)
+
+
+def bench_writes(command, options):
+    """Reads and writes from many WSGI workers on one SQLite file, before and after tuning
+
+    Before: the rollback journal with full syncs, deferred transactions and
+    a new connection per request. After: SQLITE_PRAGMAS, the configured
+    transaction mode and persistent connections.
+    """
+    from django.conf import settings
+    from django.test.utils import override_settings
+    from rest_framework.authtoken.models import Token
+    from listenapi.models import Excerpt, Recording
+    from listenapi.sample_data import make_musician, make_recordings
+
+    if connection.vendor != 'sqlite':
+        raise CommandError('The writes scenario compares SQLite configurations')
+
+    musician = make_musician('benchwriter')
+    excerpt = Excerpt.objects.create(name='Bench excerpt', musician=musician)
+    make_recordings(excerpt, 10)
+    recordings = list(Recording.objects.values_list('id', flat=True))
+    token = Token.objects.create(user=musician.user)
+
+    # every other request writes a comment; the rest read a recording's comments
+    requests = []
+    for index in range(options['requests']):
+        recording = recordings[index % len(recordings)]
+        if index % 2:
+            requests.append(('get', f'/comments?recording={recording}', None))
+        else:
+            requests.append(('post', '/comments', json.dumps({'recording': recording, 'content': f'take {index}'})))
+
+    failures = []
+
+    def judge(response, latency):
+        # the create view answers a failed insert with 200 and a message
+        if response.status_code >= 400 or (response.request['REQUEST_METHOD'] == 'POST'
+                                           and response.status_code != 201):
+            failures.append(response.status_code)
+        return latency
+
+    configurations = (
+        ('before', {'journal_mode': 'delete', 'synchronous': 'full'}, 'DEFERRED', 0),
+        ('after', settings.SQLITE_PRAGMAS, connection.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED'),
+         settings.DATABASE_CONN_MAX_AGE),
+    )
+    for label, pragmas, transaction_mode, max_age in configurations:
+        failures.clear()
+        # every worker thread's connection shares this settings dict
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.settings_dict['OPTIONS']['transaction_mode'] = transaction_mode
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            connection.close()
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                mode = cursor.fetchone()[0]
+            elapsed, latencies = run_wsgi(requests, options['clients'], judge,
+                                          HTTP_AUTHORIZATION=f'Token {token.key}')
+        command.report(label, options['clients'], elapsed, latencies)
+        command.stdout.write(f'       journal={mode} transactions={transaction_mode.lower()} '
+                             f'conn_max_age={max_age} failed={len(failures)}')
+
+
+def bench_reads(command, options):
+    """Recording reads: the viewsets under WSGI against the async views under ASGI
+
+    A list filtered by excerpt, then a recording with its comments and
+    goals, which takes three requests from the viewsets and one from
+    /async/recordings/:id.
+    """
+    from datetime import date, timedelta
+    from rest_framework.authtoken.models import Token
+    from listenapi.models import Category, Comment, Excerpt, Goal, Recording
+    from listenapi.sample_data import make_musician
+
+    musicians = [make_musician(f'benchreader{number}') for number in range(10)]
+    Excerpt.objects.bulk_create(
+        Excerpt(name=f'Excerpt {number}', musician=musicians[number % len(musicians)]) for number in range(50)
+    )
+    excerpts = list(Excerpt.objects.order_by('id'))
+    start = date(2020, 12, 1)
+    Recording.objects.bulk_create(
+        Recording(excerpt=excerpts[index % len(excerpts)], audio=f'take{index}.wav',
+                  date=start + timedelta(days=index % 365), label=f'take {index}')
+        for index in range(options['rows'])
+    )
+    recordings = list(Recording.objects.order_by('id').values_list('id', flat=True)[:100])
+    category = Category.objects.create(label='intonation')
+    Comment.objects.bulk_create(
+        Comment(recording_id=recording, author=musicians[index % len(musicians)], date=start,
+                content=f'comment {index}')
+        for recording in recordings for index in range(10)
+    )
+    Goal.objects.bulk_create(
+        Goal(recording_id=recording, category=category, goal=f'goal {index}', action='slowly')
+        for recording in recordings for index in range(5)
+    )
+    token = Token.objects.create(user=musicians[0].user)
+    headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    count = options['requests']
+    comparisons = (
+        ('GET /recordings?excerpt=',
+         [('get', f'/recordings?excerpt={excerpts[index % len(excerpts)].id}', None) for index in range(count)],
+         [('get', f'/async/recordings?excerpt={excerpts[index % len(excerpts)].id}', None)
+          for index in range(count)]),
+        ('a recording with its comments and goals',
+         [[('get', f'/recordings/{recording}', None),
+           ('get', f'/comments?recording={recording}', None),
+           ('get', f'/goals?recording={recording}', None)]
+          for recording in (recordings[index % len(recordings)] for index in range(count))],
+         [('get', f'/async/recordings/{recordings[index % len(recordings)]}', None) for index in range(count)]),
+    )
+    for title, sync_requests, async_requests in comparisons:
+        command.stdout.write(title)
+        command.report('WSGI', options['clients'], *run_wsgi(sync_requests, options['clients'], **headers))
+        command.report('ASGI', options['clients'], *run_asgi(async_requests, options['clients'], **headers))
+
+
+SCENARIOS = {
+    'login': bench_login,
+    'reads': bench_reads,
+    'serializers': bench_serializers,
+    'writes': bench_writes,
+}
+
+# Scenarios that need the test database in a file rather than in memory
+ON_DISK = {'reads', 'writes'}
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--clients', type=int, default=16,
+                            help='Concurrent clients (WSGI worker threads or in-flight ASGI requests)')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests to send in total')
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Rows to create for list scenarios')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as directory:
+            if options['scenario'] in ON_DISK and connection.vendor == 'sqlite':
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                SCENARIOS[options['scenario']](self, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def report(self, label, clients, elapsed, latencies):
+        """Print throughput and latency percentiles for one run"""
+        self.stdout.write(
+            f'{label:<6} clients={clients:<4} requests={len(latencies):<6} '
+            f'{len(latencies) / elapsed:8.1f} req/s  '
+            f'p50={statistics.median(latencies) * 1000:7.1f}ms  '
+            f'p99={percentile(latencies, 0.99) * 1000:7.1f}ms'
+        )
@@ -0,0 +1,12 @@
+"""Django's loaddata, then once for the whole load what the signals skip for raw rows"""
+from django.core.management.commands import loaddata
+from listenapi.signals import loaded_fixtures
+
+
+class Command(loaddata.Command):
+    help = loaddata.Command.help + ' Afterwards, run reconcile_counts, rebuild_search_index and rebuild_practice_stats.'
+
+    def loaddata(self, fixture_labels):
+        super().loaddata(fixture_labels)
+        if self.loaded_object_count:
+            loaded_fixtures()
@@ -0,0 +1,11 @@
+"""Recompute the daily practice rollups from the recordings and excerpts"""
+from django.core.management.base import BaseCommand
+from listenapi import practice
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every musician\'s daily practice rollups from scratch'
+
+    def handle(self, *args, **options):
+        days = practice.rebuild()
+        self.stdout.write(f'Rolled up {days} musician-days')
@@ -0,0 +1,11 @@
+"""Recompute the full-text search index from the models"""
+from django.core.management.base import BaseCommand
+from listenapi import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every search entry, e.g. after a bulk import or on an existing database'
+
+    def handle(self, *args, **options):
+        written = search.rebuild()
+        self.stdout.write(f'Indexed {written} excerpts, recordings, comments and goals')
@@ -0,0 +1,12 @@
+"""Recompute every denormalized count from the rows it counts"""
+from django.core.management.base import BaseCommand
+from listenapi import counters, graph
+
+
+class Command(BaseCommand):
+    help = 'Correct the comment, goal, recording and follow counts that drifted from the rows they count'
+
+    def handle(self, *args, **options):
+        for parent, wrong in counters.reconcile().items():
+            self.stdout.write(f'Corrected the counts of {wrong} {parent._meta.verbose_name_plural}')
+        self.stdout.write(f'Corrected the follow counts of {graph.recount()} musicians')
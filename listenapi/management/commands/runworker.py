@@ -0,0 +1,89 @@
+"""Run queued background jobs in a pool of worker processes"""
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from listenapi import jobs, worker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the job table until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=getattr(settings, 'JOB_WORKER_PROCESSES', 2),
+                            help='Jobs to run at once, each in its own process')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no jobs are due and none are running')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        poll_interval = getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+        pool = self.start_pool(processes)
+        running = {}
+
+        try:
+            while True:
+                close_old_connections()
+
+                broken = False
+                for future in [future for future in running if future.done()]:
+                    job_id = running.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool as ex:
+                        # a process died mid-job, taking the pool's other
+                        # jobs with it; count it as a failed attempt of each
+                        broken = True
+                        self.retry(job_id, repr(ex))
+                    except Exception:
+                        # execute() records the job's own errors, so this is
+                        # the queue itself failing, e.g. a locked database;
+                        # the lease expires and the job is claimed again
+                        logger.exception('Job %s could not be run', job_id)
+                if broken:
+                    pool.shutdown(wait=False)
+                    pool = self.start_pool(processes)
+
+                try:
+                    claimed = jobs.claim(processes - len(running)) if len(running) < processes else []
+                except DatabaseError:
+                    logger.exception('Could not claim jobs')
+                    claimed = []
+                for job_id in claimed:
+                    running[pool.submit(worker.run, job_id)] = job_id
+
+                if options['once'] and not claimed and not running:
+                    return
+
+                if not claimed:
+                    if running:
+                        wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    else:
+                        time.sleep(poll_interval)
+
+        except KeyboardInterrupt:
+            self.stdout.write(f'Finishing {len(running)} running jobs')
+        finally:
+            pool.shutdown(wait=True)
+
+    def retry(self, job_id, error):
+        try:
+            jobs.retry(job_id, error)
+        except DatabaseError:
+            logger.exception('Could not record the failure of job %s', job_id)
+
+    def start_pool(self, processes):
+        # spawn rather than fork, so no process inherits the parent's
+        # database connections
+        return ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=worker.setup
+        )
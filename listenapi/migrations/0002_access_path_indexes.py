@@ -0,0 +1,45 @@
+# Generated by Django 3.1.4 on 2026-10-17 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['recording', 'date'], name='comment_recording_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['date'], name='comment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connection',
+            index=models.Index(fields=['follower', 'ended_on'], name='connection_follower_ended_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connection',
+            index=models.Index(fields=['practicer', 'ended_on'], name='connection_practicer_ended_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='connection',
+            index=models.Index(condition=models.Q(ended_on__isnull=True), fields=['practicer', 'follower'], name='connection_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='excerpt',
+            index=models.Index(fields=['musician', 'done'], name='excerpt_musician_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['excerpt', 'date'], name='recording_excerpt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recording',
+            index=models.Index(fields=['date'], name='recording_date_idx'),
+        ),
+    ]
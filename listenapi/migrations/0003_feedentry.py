@@ -0,0 +1,29 @@
+# Generated by Django 3.1.4 on 2026-10-17 01:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0002_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('comment', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='listenapi.comment')),
+                ('follower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='listenapi.musician')),
+                ('musician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='listenapi.musician')),
+                ('recording', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='listenapi.recording')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['follower', 'date'], name='feedentry_follower_date_idx'),
+        ),
+    ]
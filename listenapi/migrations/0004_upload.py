@@ -0,0 +1,34 @@
+# Generated by Django 3.1.4 on 2026-10-17 01:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0003_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('path', models.CharField(blank=True, default='', max_length=255)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('completed_on', models.DateTimeField(null=True)),
+                ('musician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='listenapi.musician')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='upload',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listenapi.upload'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.4 on 2026-10-17 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0004_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recording',
+            name='channels',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='duration',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='sample_rate',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
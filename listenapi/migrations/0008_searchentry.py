@@ -0,0 +1,70 @@
+# Generated by Django 3.1.4 on 2026-10-17 01:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# External-content FTS5 table over listenapi_searchentry.text, kept in step
+# by triggers, so the text is stored once and every write path is covered
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE listenapi_searchindex USING fts5(
+        text, content='listenapi_searchentry', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER listenapi_searchentry_ai AFTER INSERT ON listenapi_searchentry BEGIN
+        INSERT INTO listenapi_searchindex(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER listenapi_searchentry_ad AFTER DELETE ON listenapi_searchentry BEGIN
+        INSERT INTO listenapi_searchindex(listenapi_searchindex, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER listenapi_searchentry_au AFTER UPDATE OF text ON listenapi_searchentry BEGIN
+        INSERT INTO listenapi_searchindex(listenapi_searchindex, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO listenapi_searchindex(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS listenapi_searchentry_au",
+    "DROP TRIGGER IF EXISTS listenapi_searchentry_ad",
+    "DROP TRIGGER IF EXISTS listenapi_searchentry_ai",
+    "DROP TABLE IF EXISTS listenapi_searchindex",
+]
+
+# The same expression listenapi.search queries with, so the planner can use it
+POSTGRESQL_INDEX = [
+    """CREATE INDEX searchentry_text_tsv_idx ON listenapi_searchentry
+        USING GIN (to_tsvector('english'::regconfig, COALESCE(text, '')))""",
+]
+POSTGRESQL_DROP = ["DROP INDEX IF EXISTS searchentry_text_tsv_idx"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0007_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('excerpt', 'Excerpt'), ('recording', 'Recording'), ('comment', 'Comment'), ('goal', 'Goal')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('text', models.TextField()),
+                ('musician', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listenapi.musician')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='searchentry_kind_object_uniq'),
+        ),
+        migrations.RunPython(
+            run({'sqlite': SQLITE_INDEX, 'postgresql': POSTGRESQL_INDEX}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.4 on 2026-10-17 01:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    """Roll up existing recordings; completion dates were never kept, so start at zero"""
+    Recording = apps.get_model('listenapi', 'Recording')
+    PracticeDay = apps.get_model('listenapi', 'PracticeDay')
+    days = Recording.objects.filter(excerpt__musician__isnull=False).values(
+        'excerpt__musician_id', 'date').annotate(count=models.Count('id')).order_by()
+    PracticeDay.objects.bulk_create(
+        (PracticeDay(musician_id=day['excerpt__musician_id'], date=day['date'], recordings=day['count'])
+         for day in days.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0008_searchentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='excerpt',
+            name='completed_on',
+            field=models.DateField(null=True),
+        ),
+        migrations.CreateModel(
+            name='PracticeDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('recordings', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('musician', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='practice_days', to='listenapi.musician')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='practiceday',
+            constraint=models.UniqueConstraint(fields=('musician', 'date'), name='practiceday_musician_date_uniq'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.4 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    Connection = apps.get_model('listenapi', 'Connection')
+    Musician = apps.get_model('listenapi', 'Musician')
+    active = Connection.objects.filter(ended_on=None, practicer__isnull=False, follower__isnull=False)
+    for musician_id, count in active.values_list('practicer_id').annotate(count=models.Count('id')).order_by():
+        Musician.objects.filter(pk=musician_id).update(follower_count=count)
+    for musician_id, count in active.values_list('follower_id').annotate(count=models.Count('id')).order_by():
+        Musician.objects.filter(pk=musician_id).update(following_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0009_practice_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='musician',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='musician',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.1.4 on 2026-10-17 02:03
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def counting(model, lookup):
+    rows = model.objects.filter(**{lookup: models.OuterRef('pk')}).order_by().values(lookup)
+    return Coalesce(models.Subquery(rows.annotate(count=models.Count('pk')).values('count'),
+                                    output_field=models.IntegerField()), 0)
+
+
+def backfill(apps, schema_editor):
+    Comment = apps.get_model('listenapi', 'Comment')
+    Excerpt = apps.get_model('listenapi', 'Excerpt')
+    Goal = apps.get_model('listenapi', 'Goal')
+    Recording = apps.get_model('listenapi', 'Recording')
+    Recording.objects.update(comment_count=counting(Comment, 'recording_id'),
+                             goal_count=counting(Goal, 'recording_id'))
+    Excerpt.objects.update(recording_count=counting(Recording, 'excerpt_id'),
+                           goal_count=counting(Goal, 'recording__excerpt_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listenapi', '0010_musician_connection_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='excerpt',
+            name='goal_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='excerpt',
+            name='recording_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recording',
+            name='goal_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
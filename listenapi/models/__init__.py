@@ -2,6 +2,12 @@ from .category import Category
 from .comment import Comment
 from .connection import Connection
 from .excerpt import Excerpt
+from .feed_entry import FeedEntry
 from .goal import Goal
+from .job import Job
 from .musician import Musician
-from .recording import Recording
\ No newline at end of file
+from .practice_day import PracticeDay
+from .recording import Recording
+from .search_entry import SearchEntry
+from .table_version import TableVersion
+from .upload import Upload
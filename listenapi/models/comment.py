@@ -1,14 +1,22 @@
 """Comment model module"""
 from django.db import models
+from .counted import CountedTowards
 
 
-class Comment(models.Model):
+class Comment(CountedTowards):
     """Comment database model"""
     author = models.ForeignKey("Musician", on_delete=models.SET_NULL, null=True, related_name="author")
     recording = models.ForeignKey("Recording", on_delete=models.SET_NULL, null=True, related_name="recording_comment")
     date = models.DateField(auto_now_add=False)
     content = models.CharField(max_length=500)
-    
+
+    class Meta:
+        indexes = [
+            # GET /comments?recording=
+            models.Index(fields=['recording', 'date'], name='comment_recording_date_idx'),
+            # GET /comments, newest first
+            models.Index(fields=['date'], name='comment_date_idx'),
+        ]
 
     @property
     def created_by_current_user(self):
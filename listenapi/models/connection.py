@@ -9,4 +9,15 @@ class Connection(models.Model):
     created_on = models.DateField(auto_now=False, auto_now_add=False)
     ended_on = models.DateField(auto_now=False, auto_now_add=False, null=True)
 
-    
+    class Meta:
+        indexes = [
+            # who a musician follows / who follows a musician, active or not
+            models.Index(fields=['follower', 'ended_on'], name='connection_follower_ended_idx'),
+            models.Index(fields=['practicer', 'ended_on'], name='connection_practicer_ended_idx'),
+            # the one active connection between a pair, looked up by unfollow
+            models.Index(
+                fields=['practicer', 'follower'],
+                condition=models.Q(ended_on__isnull=True),
+                name='connection_active_idx'
+            ),
+        ]
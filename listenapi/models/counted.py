@@ -0,0 +1,40 @@
+"""Bases for models with denormalized count columns, and for the rows they count"""
+from django.db import models, transaction
+
+
+class Counted(models.Model):
+    """A model whose `counts` columns are written only by F() updates
+
+    Saving an existing row writes every other column, so an instance loaded
+    before a count changed cannot put back the stale value.
+    """
+    counts = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not args and not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counts
+            ]
+        super().save(*args, **kwargs)
+
+
+class CountedTowards(models.Model):
+    """A model whose rows are counted in other models' `counts` columns
+
+    Saving sends pre_save and post_save inside the write's transaction, as
+    deleting already does for pre_delete and post_delete. listenapi.counters
+    can then lock the row while it compares what it counted towards before
+    and after, so concurrent writes of one row each apply their change once.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
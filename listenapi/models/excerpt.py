@@ -1,13 +1,34 @@
 """Excerpt model module"""
+from datetime import date
 from django.db import models
+from .counted import Counted
 
 
-class Excerpt(models.Model):
+class Excerpt(Counted):
     """Excerpt database model"""
     name = models.CharField(max_length=100)
     done = models.BooleanField(default=False)
     musician = models.ForeignKey("Musician", on_delete=models.SET_NULL, null=True, related_name="practicer")
+    # the day `done` was last set, for practice stats; null while not done
+    completed_on = models.DateField(null=True)
+    # recordings of this excerpt and goals on them, kept by listenapi.counters
+    recording_count = models.PositiveIntegerField(default=0)
+    goal_count = models.PositiveIntegerField(default=0)
 
+    counts = ('recording_count', 'goal_count')
+
+    class Meta:
+        indexes = [
+            # GET /excerpts?musician= and the excerpt side of /recordings?musician=
+            models.Index(fields=['musician', 'done'], name='excerpt_musician_done_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.done:
+            self.completed_on = None
+        elif self.completed_on is None:
+            self.completed_on = date.today()
+        super().save(*args, **kwargs)
 
     @property
     def created_by_current_user(self):
@@ -0,0 +1,17 @@
+"""FeedEntry model module"""
+from django.db import models
+
+
+class FeedEntry(models.Model):
+    """A recording or comment on a follower's precomputed timeline"""
+    follower = models.ForeignKey("Musician", on_delete=models.CASCADE, related_name="timeline")
+    musician = models.ForeignKey("Musician", on_delete=models.CASCADE, related_name="+")
+    recording = models.ForeignKey("Recording", on_delete=models.CASCADE, null=True, related_name="+")
+    comment = models.ForeignKey("Comment", on_delete=models.CASCADE, null=True, related_name="+")
+    date = models.DateField()
+
+    class Meta:
+        indexes = [
+            # GET /feed: one range scan of a follower's timeline, newest first
+            models.Index(fields=['follower', 'date'], name='feedentry_follower_date_idx'),
+        ]
@@ -1,7 +1,8 @@
 """ Goal model module """
 from django.db import models
+from .counted import CountedTowards
 
-class Goal(models.Model):
+class Goal(CountedTowards):
     """Goal database model"""
     recording=models.ForeignKey("Recording", on_delete=models.SET_NULL, null=True, related_name="recording_goal")
     category =models.ForeignKey("Category", on_delete=models.SET_NULL, null=True, related_name="category")
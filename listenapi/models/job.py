@@ -0,0 +1,29 @@
+"""Job model module"""
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A call of a function by dotted path, queued for `manage.py runworker`"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # a running job whose lease has expired is claimed again
+    locked_until = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True, default="")
+    created_on = models.DateTimeField(auto_now_add=True)
+    finished_on = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # the worker's poll for due jobs
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
@@ -6,6 +6,9 @@ class Musician(models.Model):
     """Musician database model"""
     user= models.OneToOneField(User, on_delete=models.CASCADE)
     bio=models.CharField(max_length=500, default="")
+    # active connections at each end, kept by listenapi.graph
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
 
     @property
@@ -0,0 +1,20 @@
+"""PracticeDay model module"""
+from django.db import models
+
+
+class PracticeDay(models.Model):
+    """How much a musician recorded and finished on one day
+
+    A rollup of Recording.date and Excerpt.completed_on per musician, kept
+    current by listenapi.practice so stats never scan the musician's history.
+    """
+    musician = models.ForeignKey("Musician", on_delete=models.CASCADE, related_name="practice_days")
+    date = models.DateField()
+    recordings = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the access path of every stats and heatmap read
+            models.UniqueConstraint(fields=['musician', 'date'], name='practiceday_musician_date_uniq'),
+        ]
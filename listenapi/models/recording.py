@@ -2,13 +2,34 @@
 from django.db import models
 from django.db.models.deletion import DO_NOTHING, SET_NULL
 from django.db.models.query import FlatValuesListIterable
+from .counted import Counted, CountedTowards
 
 
-class Recording(models.Model):
+class Recording(Counted, CountedTowards):
     """Recording database model"""
     audio = models.CharField(max_length=1000)
     excerpt = models.ForeignKey("Excerpt", on_delete=SET_NULL, null=True)
     date = models.DateField(auto_now_add=False)
     label = models.CharField(max_length=500)
+    # the finished upload `audio` points at, when it was uploaded to this server
+    upload = models.ForeignKey("Upload", on_delete=SET_NULL, null=True, related_name="+")
+    # read from the uploaded audio by listenapi.peaks; null for linked audio
+    duration = models.FloatField(null=True)
+    sample_rate = models.PositiveIntegerField(null=True)
+    channels = models.PositiveSmallIntegerField(null=True)
+    # comments and goals on this recording, kept by listenapi.counters
+    comment_count = models.PositiveIntegerField(default=0)
+    goal_count = models.PositiveIntegerField(default=0)
+
+    counts = ('comment_count', 'goal_count')
+
+    class Meta:
+        indexes = [
+            # GET /recordings?excerpt= and the per-excerpt side of ?musician=
+            models.Index(fields=['excerpt', 'date'], name='recording_excerpt_date_idx'),
+            # GET /recordings, newest first
+            models.Index(fields=['date'], name='recording_date_idx'),
+        ]
+
    
     
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""SearchEntry model module"""
+from django.db import models
+
+
+class SearchEntry(models.Model):
+    """The searchable text of one excerpt, recording, comment or goal
+
+    Kept in step with the models by listenapi.signals. The full-text index
+    over `text` lives outside the ORM: an FTS5 table maintained by triggers
+    on SQLite, or a tsvector expression index on PostgreSQL (see
+    listenapi.search).
+    """
+    EXCERPT = 'excerpt'
+    RECORDING = 'recording'
+    COMMENT = 'comment'
+    GOAL = 'goal'
+    KINDS = [(EXCERPT, 'Excerpt'), (RECORDING, 'Recording'), (COMMENT, 'Comment'), (GOAL, 'Goal')]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.IntegerField()
+    # whose page the row appears on, for ?musician= scoped searches
+    musician = models.ForeignKey("Musician", on_delete=models.SET_NULL, null=True, related_name="+")
+    text = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='searchentry_kind_object_uniq'),
+        ]
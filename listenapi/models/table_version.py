@@ -0,0 +1,9 @@
+"""TableVersion model module"""
+from django.db import models
+
+
+class TableVersion(models.Model):
+    """A counter bumped on every write to one model's table, for cheap ETags"""
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_on = models.DateTimeField()
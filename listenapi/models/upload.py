@@ -0,0 +1,20 @@
+"""Upload model module"""
+import uuid
+from django.db import models
+
+
+class Upload(models.Model):
+    """A resumable, chunked audio upload and, once complete, the stored file it became"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    musician = models.ForeignKey("Musician", on_delete=models.CASCADE, related_name="uploads")
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    path = models.CharField(max_length=255, blank=True, default="")
+    created_on = models.DateTimeField(auto_now_add=True)
+    completed_on = models.DateTimeField(null=True)
+
+    @property
+    def complete(self):
+        return self.completed_on is not None
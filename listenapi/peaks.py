@@ -0,0 +1,138 @@
+"""Waveform peaks and stream metadata for uploaded recordings
+
+For each stored audio file, the minimum and maximum sample in every run of
+`resolution` frames is precomputed at each of PEAK_RESOLUTIONS. Clients draw
+waveforms from these instead of downloading and decoding the whole take.
+Every channel is folded into one envelope.
+
+The file is decoded a block at a time. Each block is reduced to the finest
+resolution with vectorized NumPy reductions, and each coarser resolution
+is decimated from the finest. Peaks are stored next to the audio as
+little-endian int8 and int16 (min, max) pairs, one file per resolution and
+width: `<audio file>.<resolution>.i8` and `.i16`. The audio is
+content-addressed, so a file uploaded twice is only analysed once.
+
+Only PCM WAV can be decoded with the standard library. Other formats get
+no peaks or metadata.
+"""
+import os
+import wave
+import numpy as np
+from django.conf import settings
+from listenapi.models import Recording
+from listenapi.response_cache import invalidate, scopes_of
+from listenapi.uploads import media_root
+from listenapi.versions import bump
+
+PEAK_BITS = (8, 16)
+
+
+def resolutions():
+    """Frames per peak for every stored resolution, finest first"""
+    return tuple(sorted(getattr(settings, 'PEAK_RESOLUTIONS', (256, 1024, 4096, 16384))))
+
+
+def peaks_path(upload, resolution, bits):
+    return media_root() / f'{upload.path}.{resolution}.i{bits}'
+
+
+def decode(data, sample_width):
+    """PCM frames as float32 samples in [-1, 1)"""
+    if sample_width == 1:
+        # 8-bit WAV is unsigned
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if sample_width == 2:
+        return np.frombuffer(data, dtype='<i2').astype(np.float32) / 2 ** 15
+    if sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        # sign-extend from 24 bits
+        samples = (samples << 8) >> 8
+        return samples.astype(np.float32) / 2 ** 23
+    if sample_width == 4:
+        return np.frombuffer(data, dtype='<i4').astype(np.float32) / 2 ** 31
+    raise wave.Error(f'unsupported sample width {sample_width}')
+
+
+def decimate(mins, maxs, factor):
+    """Peaks of every `factor` consecutive peaks, keeping a shorter final run"""
+    starts = np.arange(0, len(mins), factor)
+    if not len(starts):
+        return mins, maxs
+    return np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+
+
+def compute_peaks(audio):
+    """(params, {resolution: (mins, maxs)}) for an open wave.Wave_read"""
+    params = audio.getparams()
+    levels = resolutions()
+    finest = levels[0]
+    # a whole number of finest peaks per read, so only the last run is short
+    block_frames = finest * 1024
+
+    mins, maxs = [], []
+    while True:
+        data = audio.readframes(block_frames)
+        if not data:
+            break
+        frames = decode(data, params.sampwidth).reshape(-1, params.nchannels)
+        block_mins, block_maxs = decimate(frames.min(axis=1), frames.max(axis=1), finest)
+        mins.append(block_mins)
+        maxs.append(block_maxs)
+
+    mins = np.concatenate(mins) if mins else np.zeros(0, dtype=np.float32)
+    maxs = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.float32)
+
+    peaks = {}
+    for resolution in levels:
+        peaks[resolution] = decimate(mins, maxs, resolution // finest)
+    return params, peaks
+
+
+def write_peaks(path, mins, maxs, bits):
+    """Store peaks as interleaved little-endian (min, max) integer pairs"""
+    scale = 2 ** (bits - 1) - 1
+    pairs = np.empty(2 * len(mins), dtype=np.float32)
+    pairs[0::2] = mins
+    pairs[1::2] = maxs
+    partial = path.with_name(path.name + '.partial')
+    np.clip(np.round(pairs * scale), -scale, scale).astype(f'<i{bits // 8}').tofile(partial)
+    # only a complete file ever has the final name
+    os.replace(partial, path)
+
+
+def analyse_recording(recording):
+    """Store peaks for a recording's uploaded audio and its duration, sample rate and channels
+
+    Returns False if the recording has no uploaded audio this module can
+    decode.
+    """
+    upload = recording.upload
+    if upload is None or not upload.path:
+        return False
+
+    try:
+        with wave.open(str(media_root() / upload.path), 'rb') as audio:
+            if all(peaks_path(upload, resolution, bits).exists()
+                   for resolution in resolutions() for bits in PEAK_BITS):
+                params = audio.getparams()
+            else:
+                params, peaks = compute_peaks(audio)
+                for resolution, (mins, maxs) in peaks.items():
+                    for bits in PEAK_BITS:
+                        write_peaks(peaks_path(upload, resolution, bits), mins, maxs, bits)
+    except (wave.Error, EOFError):
+        return False
+
+    recording.duration = params.nframes / params.framerate
+    recording.sample_rate = params.framerate
+    recording.channels = params.nchannels
+    # .update() rather than .save(), which would re-run the recording signals
+    Recording.objects.filter(pk=recording.pk).update(
+        duration=recording.duration,
+        sample_rate=recording.sample_rate,
+        channels=recording.channels
+    )
+    bump(Recording)
+    invalidate(*scopes_of(recording))
+    return True
@@ -0,0 +1,168 @@
+"""Practice statistics from per-musician, per-day rollups
+
+Every musician has a PracticeDay for each day they recorded or finished an
+excerpt. It counts the recordings dated that day and the excerpts completed
+that day. The receivers in listenapi.signals adjust the counts with F()
+updates as recordings and excerpts are written, and so do the bulk write
+paths, which send no signals. Stats and heatmaps then read one small row
+per active day from a single index, rather than joining every recording to
+its excerpt. Moving an excerpt to another musician re-derives both musicians' rows.
+`manage.py rebuild_practice_stats` re-derives every row.
+"""
+from collections import Counter
+from datetime import date, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from listenapi.models import Excerpt, PracticeDay, Recording
+
+
+def record(musician_id, day, recordings=0, completed=0):
+    """Add to (or, with negative counts, take from) a musician's day"""
+    if musician_id is None or day is None or not (recordings or completed):
+        return
+    day = as_date(day)
+    # a count that drifted is never taken below zero
+    changes = {name: F(name) + delta if delta >= 0 else Greatest(F(name) + delta, 0)
+               for name, delta in (('recordings', recordings), ('completed', completed))}
+
+    if not PracticeDay.objects.filter(musician_id=musician_id, date=day).update(**changes):
+        if recordings <= 0 and completed <= 0:
+            # nothing to take away from a day without a row
+            return
+        try:
+            with transaction.atomic():
+                PracticeDay.objects.create(musician_id=musician_id, date=day,
+                                           recordings=max(recordings, 0), completed=max(completed, 0))
+            return
+        except IntegrityError:
+            # another request created the day first
+            PracticeDay.objects.filter(musician_id=musician_id, date=day).update(**changes)
+
+    if recordings < 0 or completed < 0:
+        PracticeDay.objects.filter(musician_id=musician_id, date=day, recordings=0, completed=0).delete()
+
+
+def as_date(value):
+    """Views assign request strings to date fields; the rollups need dates"""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def musician_of(recording):
+    """Id of the musician a recording instance belongs to, without a query when its excerpt is loaded"""
+    if recording.excerpt_id is None:
+        return None
+    if Recording.excerpt.is_cached(recording):
+        return recording.excerpt.musician_id
+    return Excerpt.objects.filter(pk=recording.excerpt_id).values_list('musician_id', flat=True).first()
+
+
+def recording_day(recording_id):
+    """(musician id, date) a stored recording counts towards"""
+    return Recording.objects.filter(pk=recording_id).values_list('excerpt__musician_id', 'date').first()
+
+
+def recorded_in_bulk(recordings):
+    """Count recordings made with bulk_create"""
+    days = Counter(
+        (musician_of(recording), as_date(recording.date)) for recording in recordings
+    )
+    for (musician_id, day), count in days.items():
+        record(musician_id, day, recordings=count)
+
+
+def derived(musician_ids=None):
+    """Fresh PracticeDay rows computed from the recordings and excerpts"""
+    recordings = Recording.objects.filter(excerpt__musician__isnull=False)
+    excerpts = Excerpt.objects.filter(musician__isnull=False, completed_on__isnull=False)
+    if musician_ids is not None:
+        recordings = recordings.filter(excerpt__musician_id__in=musician_ids)
+        excerpts = excerpts.filter(musician_id__in=musician_ids)
+
+    days = {}
+    for row in recordings.values('excerpt__musician_id', 'date').annotate(count=Count('id')).order_by():
+        key = (row['excerpt__musician_id'], row['date'])
+        days[key] = PracticeDay(musician_id=key[0], date=key[1], recordings=row['count'])
+    for row in excerpts.values('musician_id', 'completed_on').annotate(count=Count('id')).order_by():
+        key = (row['musician_id'], row['completed_on'])
+        days.setdefault(key, PracticeDay(musician_id=key[0], date=key[1])).completed = row['count']
+    return days.values()
+
+
+def refresh(*musician_ids):
+    """Re-derive the rows of some musicians, e.g. after an excerpt moved between them"""
+    musician_ids = [musician_id for musician_id in musician_ids if musician_id is not None]
+    with transaction.atomic():
+        PracticeDay.objects.filter(musician_id__in=musician_ids).delete()
+        PracticeDay.objects.bulk_create(derived(musician_ids), batch_size=1000)
+
+
+def rebuild():
+    """Re-derive every row; returns how many there are"""
+    with transaction.atomic():
+        PracticeDay.objects.all().delete()
+        return len(PracticeDay.objects.bulk_create(derived(), batch_size=1000))
+
+
+def week_of(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def months_back(month, count):
+    """The first of the month `count` months before `month`"""
+    index = month.year * 12 + month.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def stats(musician_id, today, weeks=12, months=12):
+    """Totals, streaks, and dense weekly and monthly series ending at `today`"""
+    days = list(PracticeDay.objects.filter(musician_id=musician_id).order_by('date')
+                .values_list('date', 'recordings', 'completed'))
+    practiced = [day for day, recordings, _ in days if recordings and day <= today]
+
+    longest = run = 0
+    previous = None
+    for day in practiced:
+        run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    # a streak is still current if the musician last practised yesterday
+    current = run if practiced and today - practiced[-1] <= timedelta(days=1) else 0
+
+    first_week = week_of(today) - timedelta(weeks=weeks - 1)
+    by_week = {first_week + timedelta(weeks=index): {'recordings': 0, 'days': 0} for index in range(weeks)}
+    first_month = months_back(month_of(today), months - 1)
+    by_month = {months_back(month_of(today), index): {'recordings': 0, 'completed': 0}
+                for index in reversed(range(months))}
+
+    for day, recordings, completed in days:
+        if day > today:
+            continue
+        if day >= first_week:
+            week = by_week[week_of(day)]
+            week['recordings'] += recordings
+            week['days'] += bool(recordings)
+        if day >= first_month:
+            month = by_month[month_of(day)]
+            month['recordings'] += recordings
+            month['completed'] += completed
+
+    return {
+        'recordings': sum(recordings for _, recordings, _ in days),
+        'completed': sum(completed for _, _, completed in days),
+        'days_practiced': len(practiced),
+        'last_practiced': practiced[-1] if practiced else None,
+        'current_streak': current,
+        'longest_streak': longest,
+        'weeks': [{'week': week, **counts} for week, counts in by_week.items()],
+        'months': [{'month': month.strftime('%Y-%m'), **counts} for month, counts in by_month.items()],
+    }
+
+
+def heatmap(musician_id, start, end):
+    """The days from `start` to `end` with any activity, oldest first"""
+    return PracticeDay.objects.filter(musician_id=musician_id, date__gte=start, date__lte=end).order_by('date')
@@ -0,0 +1,161 @@
+"""Reads from replica databases, with read-your-writes
+
+REPLICA_DATABASES names database aliases that hold copies of the primary
+('default'), kept in step by replication outside Django. While a request is
+served, ReplicaRouter sends its reads to one of them at random and every
+write to the primary.
+
+A replica can lag behind the primary, so a client must not read from one
+just after it wrote:
+- Once a request writes, its later reads go to the primary too, and so do
+  reads inside a transaction, which are usually about to write.
+- A response to a request that wrote carries the time until which that
+  client reads from the primary, REPLICA_PIN_SECONDS ahead. It is sent as
+  the primary_until cookie and as an X-Primary-Until header, which clients
+  that do not keep cookies send back.
+
+Outside requests (management commands, the job worker, tests) every read
+goes to the primary, and so do reads under `reading_primary()`, such as
+those building a cached response that later requests share, and those of
+the signal receivers that note a row's state before it is written.
+"""
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+COOKIE = 'primary_until'
+HEADER = 'X-Primary-Until'
+
+
+class Reads:
+    """Where the current request may read from"""
+
+    def __init__(self, pinned):
+        # reads go to the primary because the client wrote recently
+        self.pinned = pinned
+        # this request has written
+        self.wrote = False
+
+    @property
+    def primary(self):
+        return self.pinned or self.wrote
+
+
+_reads = ContextVar('replica_reads', default=None)
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+@contextmanager
+def reading_primary():
+    """Send the current request's reads to the primary inside the block
+
+    Also a decorator, for functions whose every read must be current.
+    """
+    reads = _reads.get()
+    if reads is None:
+        yield
+        return
+    pinned, reads.pinned = reads.pinned, True
+    try:
+        yield
+    finally:
+        reads.pinned = pinned
+
+
+class ReplicaRouter:
+    """Reads from a replica unless the request is pinned; writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or reads.primary or not replicas():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # what a transaction reads decides what it writes
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        reads = _reads.get()
+        if reads is not None:
+            reads.wrote = True
+        # never the database an instance was read from, which may be a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the primary's schema through replication
+        if db in replicas():
+            return False
+        return None
+
+
+def pinned_until(request):
+    """The time a request's cookie or header pins it to the primary until, or 0"""
+    until = 0
+    for value in (request.COOKIES.get(COOKIE), request.headers.get(HEADER)):
+        try:
+            until = max(until, float(value))
+        except (TypeError, ValueError):
+            pass
+    return until
+
+
+class PrimaryPinningMiddleware:
+    """Route a request's reads, and pin a client that wrote to the primary for a while
+
+    Both sync and async, so that under ASGI async views are not sent
+    through a thread for this middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # how Django's MiddlewareMixin marks an instance as a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        reads, token = self.route(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self.pin(reads, response)
+
+    async def __acall__(self, request):
+        reads, token = self.route(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self.pin(reads, response)
+
+    def route(self, request):
+        reads = Reads(pinned=pinned_until(request) > time.time())
+        return reads, _reads.set(reads)
+
+    def pin(self, reads, response):
+        if reads.wrote:
+            until = time.time() + pin_seconds()
+            response.set_cookie(COOKIE, f'{until:.3f}', max_age=pin_seconds(), samesite='Lax')
+            response[HEADER] = f'{until:.3f}'
+        return response
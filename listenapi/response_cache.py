@@ -0,0 +1,158 @@
+"""Cached list responses, invalidated by scope
+
+A cached list belongs to one or more scopes: the musician or recording it
+is filtered by, plus the tables whose rows are nested in every payload
+(users and musicians, categories). Each scope has a generation number in
+the cache, and the number is part of every key made under that scope.
+The receivers in listenapi.signals invalidate a scope by bumping its
+generation whenever a row in it is written. Older entries are then never
+read again and age out on their own.
+
+When many requests miss on the same key at once, only one of them builds
+the response. The others wait for it to appear in the cache (single
+flight).
+
+Generations and entries live in Django's cache. Invalidation can only
+reach a cache the writing process can see. With several worker processes,
+configure a shared backend such as FileBasedCache. With the per-process
+local-memory default, another process can serve an entry for up to
+RESPONSE_CACHE_TIMEOUT seconds after a write.
+"""
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from listenapi.models import Comment, Excerpt, Goal, Recording
+from listenapi.replicas import reading_primary
+from listenapi.streaming import wants_stream
+
+# scopes nested in every cached payload
+PEOPLE = ('people',)
+CATEGORIES = ('categories',)
+
+
+def timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def generation_key(scope):
+    return 'gen:' + ':'.join(str(part) for part in scope)
+
+
+def generations(scopes):
+    """Current generation of each scope, starting any that are missing"""
+    keys = [generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # a fresh, never-before-used number, so an evicted generation
+            # cannot come back to a value older entries were cached under
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """Make every entry cached under any of `scopes` unreachable"""
+    for scope in scopes:
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def scopes_of(instance):
+    """Scopes of the cached lists whose payloads include `instance`"""
+    if isinstance(instance, Excerpt):
+        # /excerpts and /recordings by musician, and the goals and comments
+        # of its recordings, which show the excerpt's name
+        recordings = Recording.objects.filter(excerpt_id=instance.pk).values_list('id', flat=True)
+        return {('musician', instance.musician_id)} | {('recording', pk) for pk in recordings}
+    if isinstance(instance, Recording):
+        if Recording.excerpt.is_cached(instance):
+            musician_id = instance.excerpt.musician_id
+        else:
+            musician_id = Excerpt.objects.filter(pk=instance.excerpt_id).values_list('musician_id', flat=True).first()
+        return {('musician', musician_id), ('recording', instance.pk)}
+    if isinstance(instance, (Comment, Goal)):
+        return {('recording', instance.recording_id)}
+    return set()
+
+
+def get_or_build(key, build):
+    """The cached value of `key`, or `build()`'s, building at most once at a time per key
+
+    `build` returns (value, cacheable); only cacheable values are stored.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock = key + ':building'
+    wait = getattr(settings, 'RESPONSE_CACHE_BUILD_WAIT', 5)
+
+    if not cache.add(lock, 1, wait):
+        # another request is building this entry; wait for its result
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.get(lock) is None:
+                break
+
+    try:
+        value, cacheable = build()
+        if cacheable:
+            cache.set(key, value, timeout())
+        return value
+    finally:
+        cache.delete(lock)
+
+
+def cached_list(param, scope, *also, per_viewer=False):
+    """Cache a viewset list handler's responses when it is filtered by `param`
+
+    The entry is filed under (`scope`, value of `param`), PEOPLE and
+    `also`. With `per_viewer`, each viewer gets their own entry, for
+    payloads that say whether the viewer wrote each row. Unfiltered and
+    streamed lists are never cached.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            try:
+                # the same id however it was spelled, as invalidation uses it
+                value = int(request.query_params[param])
+            except (KeyError, ValueError):
+                value = None
+            if value is None or wants_stream(request):
+                return handler(self, request, *args, **kwargs)
+
+            scopes = [(scope, value), PEOPLE, *also]
+            key = [handler.__qualname__, request.build_absolute_uri(),
+                   request.META.get('HTTP_ACCEPT', '')]
+            key += [str(generation) for generation in generations(scopes)]
+            if per_viewer:
+                key.append(str(request.user.pk))
+            key = 'list:' + hashlib.sha1('\n'.join(key).encode('utf-8')).hexdigest()
+
+            built = []
+
+            def build():
+                # from the primary: an entry built from a lagging replica
+                # would outlive the write that bumped the generation
+                with reading_primary():
+                    response = handler(self, request, *args, **kwargs)
+                built.append(response)
+                return response.data, response.status_code == 200
+
+            data = get_or_build(key, build)
+            # a response built by this request is returned as is, errors included
+            return built[0] if built else Response(data)
+        return wrapper
+    return decorator
@@ -0,0 +1,21 @@
+"""Musicians and recordings made up for the tests and the bench command"""
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from listenapi.models import Musician, Recording
+
+
+def make_musician(username):
+    """Create a user and its musician profile"""
+    user = User.objects.create_user(username=username, password='password')
+    return Musician.objects.create(user=user, bio='')
+
+
+def make_recordings(excerpt, count):
+    """Create `count` recordings of an excerpt on consecutive days"""
+    for day in range(count):
+        Recording.objects.create(
+            excerpt=excerpt,
+            audio='urlstring',
+            date=date(2020, 12, 1) + timedelta(days=day),
+            label=f'{excerpt.name} take {day}'
+        )
@@ -0,0 +1,133 @@
+"""Full-text search over excerpt names, recording labels, comments and goals
+
+Each searchable row has one SearchEntry holding its text and the musician
+whose page it appears on. The receivers in listenapi.signals rewrite the
+entry whenever the row is saved and delete it when the row is.
+
+On SQLite the entries are indexed by an external-content FTS5 table,
+listenapi_searchindex, which triggers on the entry table keep current. It
+uses the porter stemmer, so "bowing" finds "bow", and results are ranked
+by bm25. On PostgreSQL a GIN index over to_tsvector('english', text) plays
+the same part, ranked by ts_rank. Both are created by migration 0008.
+`manage.py rebuild_search_index` recomputes every entry from the models.
+"""
+import re
+from django.db import connection, transaction
+from django.db.models import Q
+from listenapi.models import Comment, Excerpt, Goal, Recording, SearchEntry
+
+# kind: (model, text columns, lookup of the musician whose page it is on)
+SOURCES = {
+    SearchEntry.EXCERPT: (Excerpt, ('name',), 'musician_id'),
+    SearchEntry.RECORDING: (Recording, ('label',), 'excerpt__musician_id'),
+    SearchEntry.COMMENT: (Comment, ('content',), 'recording__excerpt__musician_id'),
+    SearchEntry.GOAL: (Goal, ('goal', 'action'), 'recording__excerpt__musician_id'),
+}
+KIND_OF = {model: kind for kind, (model, _, _) in SOURCES.items()}
+
+BATCH_SIZE = 1000
+
+
+def entries(kind, queryset):
+    """Fresh SearchEntry instances for the rows of `queryset`, one query"""
+    _, columns, musician = SOURCES[kind]
+    rows = queryset.values_list('id', musician, *columns)
+    for pk, musician_id, *text in rows.iterator(chunk_size=BATCH_SIZE):
+        yield SearchEntry(kind=kind, object_id=pk, musician_id=musician_id,
+                          text='\n'.join(part for part in text if part))
+
+
+def index(model, ids):
+    """Rewrite the entries of the `model` rows with `ids`"""
+    kind = KIND_OF[model]
+    with transaction.atomic():
+        SearchEntry.objects.filter(kind=kind, object_id__in=ids).delete()
+        SearchEntry.objects.bulk_create(entries(kind, model.objects.filter(pk__in=ids)), BATCH_SIZE)
+
+
+def unindex(model, ids):
+    SearchEntry.objects.filter(kind=KIND_OF[model], object_id__in=ids).delete()
+
+
+def reown(instance):
+    """Move the entries under an excerpt or recording to its current musician
+
+    A no-op unless the owner changed. The text is untouched, so the
+    full-text index is not rewritten.
+    """
+    if isinstance(instance, Excerpt):
+        musician_id = instance.musician_id
+        recordings = Recording.objects.filter(excerpt_id=instance.pk).values('id')
+        owned = Q(kind=SearchEntry.RECORDING, object_id__in=recordings)
+    else:
+        musician_id = Excerpt.objects.filter(pk=instance.excerpt_id).values_list('musician_id', flat=True).first()
+        recordings = [instance.pk]
+        owned = Q(pk__in=[])
+
+    owned |= Q(kind=SearchEntry.COMMENT, object_id__in=Comment.objects.filter(recording_id__in=recordings).values('id'))
+    owned |= Q(kind=SearchEntry.GOAL, object_id__in=Goal.objects.filter(recording_id__in=recordings).values('id'))
+    SearchEntry.objects.filter(owned).exclude(musician_id=musician_id).update(musician_id=musician_id)
+
+
+def rebuild():
+    """Recompute every entry from the models; returns how many were written"""
+    written = 0
+    with transaction.atomic():
+        SearchEntry.objects.all().delete()
+        for kind, (model, _, _) in SOURCES.items():
+            written += len(SearchEntry.objects.bulk_create(entries(kind, model.objects.all()), BATCH_SIZE))
+    if connection.vendor == 'sqlite':
+        # merge the index's b-trees after a bulk load
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO listenapi_searchindex(listenapi_searchindex) VALUES ('optimize')")
+    return written
+
+
+def match_expression(text):
+    """An FTS5 query for every word of `text`, each as a prefix
+
+    User input is reduced to quoted words, so FTS5 operators and syntax
+    errors cannot come from it.
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search(text, kinds=None, musician_id=None, limit=10, offset=0):
+    """[(kind, object_id, rank)] of the entries best matching `text`, best first"""
+    if not re.search(r'\w', text):
+        return []
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(text, kinds, musician_id, limit, offset)
+
+    sql = ['SELECT e.kind, e.object_id, -bm25(listenapi_searchindex) AS rank',
+           'FROM listenapi_searchindex JOIN listenapi_searchentry e ON e.id = listenapi_searchindex.rowid',
+           'WHERE listenapi_searchindex MATCH %s']
+    params = [match_expression(text)]
+    if kinds:
+        sql.append(f"AND e.kind IN ({', '.join(['%s'] * len(kinds))})")
+        params += list(kinds)
+    if musician_id is not None:
+        sql.append('AND e.musician_id = %s')
+        params.append(musician_id)
+    sql.append('ORDER BY rank DESC, e.id DESC LIMIT %s OFFSET %s')
+    params += [limit, offset]
+
+    with connection.cursor() as cursor:
+        cursor.execute('\n'.join(sql), params)
+        return cursor.fetchall()
+
+
+def _search_postgresql(text, kinds, musician_id, limit, offset):
+    # only importable with psycopg2 installed, which PostgreSQL needs anyway
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    query = SearchQuery(text, config='english')
+    matches = SearchEntry.objects.annotate(
+        document=SearchVector('text', config='english')
+    ).filter(document=query)
+    if kinds:
+        matches = matches.filter(kind__in=kinds)
+    if musician_id is not None:
+        matches = matches.filter(musician_id=musician_id)
+    matches = matches.annotate(rank=SearchRank('document', query)).order_by('-rank', '-id')
+    return list(matches.values_list('kind', 'object_id', 'rank')[offset:offset + limit])
@@ -0,0 +1,276 @@
+"""Shared JSON representations of the listen models
+
+Each representation is a Projection: an ordered description of the keys of
+one model's JSON, where a foreign key can expand into a nested projection of
+the related model. A list endpoint asks the projection for one flat
+`.values()` query across every join it needs and renders each row into nested
+dicts in a single pass, rather than running a ModelSerializer per object.
+The output matches what the per-view ModelSerializers used to produce.
+
+Clients can ask for less with `?fields=` and `?expand=` (see
+`Projection.for_request`). The projection is pruned before the query is
+built, so columns and joins that would not be rendered are never selected.
+"""
+from django.db.models import BooleanField, Case, Model, Value, When
+from rest_framework.exceptions import ParseError
+
+
+class Projection:
+    """Nested JSON representation of a model, rendered from flat .values() rows
+
+    `fields` are output keys in order. A string is a column (or annotation)
+    of the model; a (name, Projection) pair is a foreign key rendered as a
+    nested object, or null when the key is null. Names in `computed` are
+    optional: they are read when the queryset annotates them (or the
+    instance has them), and left out otherwise, as DRF skips an unset
+    read-only attribute.
+    """
+
+    def __init__(self, *fields, computed=(), hidden=()):
+        self.fields = tuple(field if isinstance(field, tuple) else (field, None) for field in fields)
+        self.computed = frozenset(computed)
+        # selected but not rendered, e.g. the columns a page's cursor is made of
+        self.hidden = tuple(hidden)
+        self._plan = self._compile('')
+
+    def _compile(self, prefix):
+        """(key, row lookup, nested plan, computed?) for each field, all levels deep"""
+        return tuple(
+            (name, prefix + name,
+             None if nested is None else nested._compile(prefix + name + '__'),
+             name in self.computed)
+            for name, nested in self.fields
+        )
+
+    def lookups(self, prefix=''):
+        """The .values() lookups that rendering reads"""
+        for name, nested in self.fields:
+            if name in self.computed:
+                continue
+            # a nested object's own key tells render() whether it is null
+            yield prefix + name
+            if nested is not None:
+                yield from nested.lookups(prefix + name + '__')
+
+    def values(self, queryset):
+        """`queryset` as the flat rows this representation renders from"""
+        annotated = [
+            name for name, _ in self.fields
+            if name in self.computed and name in queryset.query.annotations
+        ]
+        lookups = list(self.lookups())
+        hidden = [lookup for lookup in self.hidden if lookup not in lookups]
+        return queryset.values(*lookups, *annotated, *hidden)
+
+    def select(self, fields=None, expand=None, path=''):
+        """A copy pruned to `fields`, with only the relations in `expand` nested
+
+        Both are trees of dicts keyed by field name, as built by
+        `field_tree`. `fields=None` keeps every field. A relation that is
+        not expanded renders as its id. A relation with fields picked inside
+        it (`recording.label`) counts as expanded.
+        """
+        known = dict(self.fields)
+        for tree in (fields or {}, expand):
+            for name in tree:
+                if name not in known:
+                    raise ValueError(f'Unknown field {path}{name}')
+                if (tree is expand or tree[name]) and known[name] is None:
+                    raise ValueError(f'{path}{name} is not a relation')
+
+        selected = []
+        for name, nested in self.fields:
+            if fields and name not in fields:
+                continue
+            if nested is not None:
+                inner = fields.get(name) if fields else None
+                if name in expand or inner:
+                    nested = nested.select(inner or None, expand.get(name, {}), f'{path}{name}.')
+                else:
+                    nested = None
+            selected.append(name if nested is None else (name, nested))
+        return Projection(*selected, computed=self.computed)
+
+    def for_request(self, request, view=None):
+        """This representation as pruned by the request's ?fields= and ?expand=
+
+        Both take comma-separated, dot-separated paths. With neither, the
+        full representation is returned. With either, relations render as
+        ids unless they are expanded. The columns of `view`'s ordering are
+        always selected, so a page can still be given a cursor.
+        """
+        fields, expand = requested_fields(request)
+        if fields is None and expand is None:
+            return self
+
+        try:
+            pruned = self.select(fields, expand)
+        except ValueError as ex:
+            raise ParseError(ex.args[0])
+
+        ordering = getattr(view, 'ordering', ('-id',)) if view is not None else ()
+        pruned.hidden = tuple(field.lstrip('-') for field in ordering)
+        return pruned
+
+    def selecting(self, *lookups):
+        """This projection, or a copy that also selects `lookups`, e.g. the id a view matches its rows up by"""
+        selected = set(self.lookups()) | set(self.hidden)
+        missing = tuple(lookup for lookup in lookups if lookup not in selected)
+        if not missing:
+            return self
+        return Projection(*self.fields, computed=self.computed, hidden=self.hidden + missing)
+
+    def render(self, row):
+        """Nested representation of one .values() row"""
+        return _render_row(self._plan, row)
+
+    def render_many(self, rows):
+        plan = self._plan
+        return [_render_row(plan, row) for row in rows]
+
+    def render_instance(self, instance):
+        """Nested representation of a model instance, e.g. one just created"""
+        return _render_instance(self._plan, instance)
+
+
+def field_tree(paths):
+    """{'recording': {'label': {}}, 'id': {}} from 'recording.label,id'"""
+    tree = {}
+    for path in paths.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def requested_fields(request):
+    """The ?fields= and ?expand= trees of a request, (None, None) when it has neither
+
+    With only ?expand=, fields is None (every field); with only ?fields=,
+    expand is empty (no relation nested unless fields are picked inside it).
+    """
+    fields = request.query_params.get('fields')
+    expand = request.query_params.get('expand')
+    if fields is None and expand is None:
+        return None, None
+    return (field_tree(fields) if fields else None), field_tree(expand or '')
+
+
+def _render_row(plan, row):
+    representation = {}
+    for name, lookup, nested, computed in plan:
+        if nested is not None:
+            representation[name] = None if row[lookup] is None else _render_row(nested, row)
+        elif not computed:
+            representation[name] = row[lookup]
+        elif lookup in row:
+            representation[name] = row[lookup]
+    return representation
+
+
+def _render_instance(plan, instance):
+    representation = {}
+    for name, _, nested, computed in plan:
+        try:
+            value = getattr(instance, name)
+        except AttributeError:
+            if computed:
+                continue
+            raise
+        if nested is not None and value is not None:
+            value = _render_instance(nested, value)
+        elif isinstance(value, Model):
+            # a foreign key without a nested projection renders as its id
+            value = value.pk
+        representation[name] = value
+    return representation
+
+
+def viewer_is(request, lookup):
+    """Annotation that is true where `lookup` is the viewer's musician id
+
+    For flags like created_by_current_user, computed in the same query as
+    the rows. False everywhere for a viewer without a musician profile.
+    """
+    musician = getattr(request.user, 'musician', None)
+    if musician is None:
+        return Value(False, output_field=BooleanField())
+    return Case(
+        When(**{lookup: musician.id}, then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField()
+    )
+
+
+CATEGORY = Projection('id', 'label')
+
+USER = Projection('id', 'first_name', 'last_name', 'email')
+USER_NAME = Projection('first_name', 'last_name', 'email')
+USER_PROFILE = Projection('first_name', 'last_name', 'username', 'email')
+
+# musicians nested in comments, excerpts and connections carry the user's id
+MUSICIAN = Projection('id', 'bio', ('user', USER))
+MUSICIAN_NAME = Projection('id', 'bio', ('user', USER_NAME))
+# /musicians and /currentuser
+MUSICIAN_PROFILE = Projection('id', 'bio', ('user', USER_PROFILE), 'follower_count', 'following_count',
+                              'is_current_user', 'is_following', computed=('is_current_user', 'is_following'))
+# /musicians/:id/followers and /following: the connection and the musician at its other end
+FOLLOWER = Projection('id', ('follower', MUSICIAN), 'created_on')
+FOLLOWING = Projection('id', ('practicer', MUSICIAN), 'created_on')
+
+EXCERPT = Projection('id', 'name', ('musician', MUSICIAN), 'done', 'recording_count', 'goal_count',
+                     'created_by_current_user')
+
+RECORDING = Projection(
+    'id', 'audio',
+    ('excerpt', Projection('id', 'name', ('musician', MUSICIAN_NAME))),
+    'date', 'label', 'duration', 'sample_rate', 'channels', 'comment_count', 'goal_count'
+)
+
+COMMENT = Projection(
+    'id', ('author', MUSICIAN),
+    ('recording', Projection('audio', ('excerpt', Projection('id', 'name')), 'date', 'label')),
+    'date', 'content', 'created_by_current_user'
+)
+
+GOAL = Projection(
+    'id',
+    ('recording', Projection(
+        'audio', ('excerpt', Projection('id', 'name', ('musician', MUSICIAN_NAME))), 'date', 'label'
+    )),
+    ('category', CATEGORY),
+    'goal', 'action'
+)
+
+CONNECTION = Projection('id', ('practicer', MUSICIAN), ('follower', MUSICIAN), 'created_on', 'ended_on')
+
+FEED_ENTRY = Projection(
+    'id', 'date',
+    ('musician', Projection('id', 'bio', ('user', Projection('id', 'first_name', 'last_name', 'username')))),
+    ('recording', Projection('id', 'audio', ('excerpt', Projection('id', 'name')), 'date', 'label')),
+    ('comment', Projection('id', 'recording', 'date', 'content')),
+)
+
+# /musicians/:id/dashboard, where the musician is given once at the top and
+# goals and comments are nested under their recording
+DASHBOARD_EXCERPT = Projection('id', 'name', 'done', 'recording_count', 'goal_count', 'created_by_current_user')
+DASHBOARD_RECORDING = Projection(
+    'id', 'audio', ('excerpt', Projection('id', 'name')), 'date', 'label', 'duration', 'sample_rate', 'channels',
+    'comment_count', 'goal_count'
+)
+DASHBOARD_GOAL = Projection('id', 'recording', ('category', CATEGORY), 'goal', 'action')
+DASHBOARD_COMMENT = Projection('id', 'recording', ('author', MUSICIAN), 'date', 'content', 'created_by_current_user')
+
+# /search and /musicians/:id/suggestions: envelopes whose views render them
+# key by key, so that ?fields= and ?expand= can reach the projections inside
+SEARCH_RESULT = Projection('type', 'rank', ('excerpt', EXCERPT), ('recording', RECORDING), ('comment', COMMENT),
+                           ('goal', GOAL))
+SUGGESTION = Projection(('musician', MUSICIAN), 'mutual')
+
+# /musicians/:id/stats, rendered from the dict listenapi.practice computes, and /heatmap
+PRACTICE_STATS = Projection('recordings', 'completed', 'days_practiced', 'last_practiced', 'current_streak',
+                            'longest_streak', 'weeks', 'months')
+PRACTICE_DAY = Projection('date', 'recordings', 'completed')
+
+UPLOAD = Projection('id', 'filename', 'size', 'received', 'complete', 'sha256', computed=('complete',))
@@ -0,0 +1,323 @@
+"""Signal receivers that keep derived tables in step with the models
+
+The receivers that note a row's state before it is saved or deleted read
+from the primary: a lagging replica would make them compare against a
+stale row, and the derived tables would drift for good.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from listenapi import counters, graph, practice, search
+from listenapi.authentication import token_cache
+from listenapi.jobs import enqueue, enqueue_many
+from listenapi.models import Category, Comment, Connection, Excerpt, FeedEntry, Goal, Musician, Recording
+from listenapi.replicas import reading_primary
+from listenapi.response_cache import CATEGORIES, PEOPLE, invalidate, scopes_of
+from listenapi.versions import bump
+
+
+@receiver(post_save, sender=Recording)
+def recording_saved(sender, instance, created, raw=False, **kwargs):
+    """Queue a recording's fan-out to followers when it is new or changes musician, else keep its date current"""
+    if raw:
+        return
+    # noted by remember_practice_day below
+    before = getattr(instance, '_practice_day', None)
+    if created or before is None or before[0] != practice.musician_of(instance):
+        # the fan-out replaces its entries, taking it off the old musician's followers' timelines
+        enqueue('listenapi.tasks.fan_out_recording', instance.id)
+    else:
+        FeedEntry.objects.filter(recording=instance).update(date=instance.date)
+        bump(FeedEntry)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    """Queue a new comment's fan-out to its author's followers"""
+    if raw:
+        return
+    if created:
+        enqueue('listenapi.tasks.fan_out_comment', instance.id)
+    else:
+        FeedEntry.objects.filter(comment=instance).update(date=instance.date)
+        bump(FeedEntry)
+
+
+@receiver(post_save, sender=Connection)
+@receiver(post_delete, sender=Connection)
+def connection_changed(sender, instance, raw=False, **kwargs):
+    """Starting, ending or deleting a connection queues a rebuild of the follower's timeline"""
+    if raw or instance.follower_id is None:
+        return
+    enqueue('listenapi.tasks.rebuild_timeline', instance.follower_id)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    """Drop a changed or deleted token from the authentication cache"""
+    token_cache.forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Drop the cached token of a changed or deleted user"""
+    token_cache.forget_user(instance.id)
+
+
+@receiver(post_save, sender=Musician)
+@receiver(post_delete, sender=Musician)
+def musician_changed(sender, instance, **kwargs):
+    """Drop the cached token of a musician's user"""
+    token_cache.forget_user(instance.user_id)
+
+
+# Tables whose version (listenapi.versions) conditional GETs depend on
+VERSIONED = (Category, Comment, Connection, Excerpt, Goal, Musician, Recording, User)
+
+
+def table_changed(sender, raw=False, **kwargs):
+    """Bump the version of a table that was written to"""
+    if raw:
+        return
+    bump(sender)
+
+
+for model in VERSIONED:
+    post_save.connect(table_changed, sender=model)
+    post_delete.connect(table_changed, sender=model)
+
+
+@receiver(pre_save, sender=Excerpt)
+@receiver(pre_save, sender=Recording)
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=Goal)
+@receiver(pre_delete, sender=Excerpt)
+@receiver(pre_delete, sender=Recording)
+@receiver(pre_delete, sender=Comment)
+@receiver(pre_delete, sender=Goal)
+@reading_primary()
+def remember_cache_scopes(sender, instance, raw=False, **kwargs):
+    """Note the cached lists a row is in before it moves or goes away"""
+    if raw:
+        return
+    stored = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._cache_scopes = scopes_of(stored) if stored else set()
+
+
+@receiver(post_save, sender=Excerpt)
+@receiver(post_save, sender=Recording)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Excerpt)
+@receiver(post_delete, sender=Recording)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Goal)
+def invalidate_cached_lists(sender, instance, raw=False, **kwargs):
+    """Drop the cached lists a row was in and the ones it is in now"""
+    if raw:
+        return
+    scopes = getattr(instance, '_cache_scopes', set())
+    if kwargs['signal'] is post_save:
+        scopes = scopes | scopes_of(instance)
+    invalidate(*scopes)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Musician)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Musician)
+def invalidate_people(sender, raw=False, **kwargs):
+    """Names and bios are nested in every cached list"""
+    if raw:
+        return
+    invalidate(PEOPLE)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate(CATEGORIES)
+
+
+@receiver(post_save, sender=Excerpt)
+@receiver(post_save, sender=Recording)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Goal)
+def index_for_search(sender, instance, created, raw=False, **kwargs):
+    """Rewrite a row's search entry, and follow an owner change down to its children"""
+    if raw:
+        return
+    search.index(sender, [instance.pk])
+    if not created and sender in (Excerpt, Recording):
+        search.reown(instance)
+
+
+@receiver(post_delete, sender=Excerpt)
+@receiver(post_delete, sender=Recording)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Goal)
+def unindex_for_search(sender, instance, **kwargs):
+    search.unindex(sender, [instance.pk])
+
+
+@receiver(pre_save, sender=Recording)
+@receiver(pre_delete, sender=Recording)
+@reading_primary()
+def remember_practice_day(sender, instance, raw=False, **kwargs):
+    """Note which musician and day a recording counted towards before it changes"""
+    if raw:
+        return
+    instance._practice_day = practice.recording_day(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=Recording)
+def recording_practice_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_practice_day', None)
+    new = (practice.musician_of(instance), practice.as_date(instance.date))
+    if old != new:
+        if old is not None:
+            practice.record(*old, recordings=-1)
+        practice.record(*new, recordings=1)
+
+
+@receiver(post_delete, sender=Recording)
+def recording_practice_deleted(sender, instance, **kwargs):
+    old = getattr(instance, '_practice_day', None)
+    if old is not None:
+        practice.record(*old, recordings=-1)
+
+
+@receiver(pre_save, sender=Excerpt)
+@reading_primary()
+def remember_completion(sender, instance, raw=False, **kwargs):
+    """Note an excerpt's musician and completion day before it changes"""
+    if raw:
+        return
+    instance._completion = Excerpt.objects.filter(pk=instance.pk).values_list(
+        'musician_id', 'completed_on').first() if instance.pk else None
+
+
+@receiver(post_save, sender=Excerpt)
+def excerpt_practice_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_musician, old_day = getattr(instance, '_completion', None) or (instance.musician_id, None)
+    if old_musician != instance.musician_id:
+        # its recordings and completion move with it
+        practice.refresh(old_musician, instance.musician_id)
+    elif old_day != instance.completed_on:
+        practice.record(old_musician, old_day, completed=-1)
+        practice.record(instance.musician_id, instance.completed_on, completed=1)
+
+
+@receiver(post_save, sender=Excerpt)
+def excerpt_feed_changed(sender, instance, raw=False, **kwargs):
+    """An excerpt moved to another musician takes its recordings to the new musician's followers"""
+    completion = getattr(instance, '_completion', None)
+    if raw or completion is None or completion[0] == instance.musician_id:
+        return
+    enqueue_many('listenapi.tasks.fan_out_recording',
+                 [(recording_id,) for recording_id in
+                  Recording.objects.filter(excerpt=instance).values_list('id', flat=True)])
+
+
+@receiver(post_delete, sender=Excerpt)
+def excerpt_practice_deleted(sender, instance, **kwargs):
+    # its recordings were detached from it, and so from the musician
+    practice.refresh(instance.musician_id)
+
+
+@receiver(pre_save, sender=Connection)
+@receiver(pre_delete, sender=Connection)
+@reading_primary()
+def remember_active_pair(sender, instance, raw=False, **kwargs):
+    """Note whether a connection was active, and between whom, before it changes"""
+    if raw:
+        return
+    stored = Connection.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._active_pair = graph.active_pair(stored)
+
+
+@receiver(post_save, sender=Connection)
+@receiver(post_delete, sender=Connection)
+def connection_counts_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    after = graph.active_pair(instance) if kwargs['signal'] is post_save else None
+    graph.connection_changed(getattr(instance, '_active_pair', None), after)
+
+
+@receiver(pre_delete, sender=Musician)
+@reading_primary()
+def musician_leaving_graph(sender, instance, **kwargs):
+    # runs before SET_NULL detaches the connections, which sends no signals
+    graph.musician_deleted(instance.pk)
+
+
+@receiver(pre_save, sender=Recording)
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=Goal)
+@receiver(pre_delete, sender=Recording)
+@receiver(pre_delete, sender=Comment)
+@receiver(pre_delete, sender=Goal)
+@reading_primary()
+def remember_counted(sender, instance, raw=False, **kwargs):
+    """Note which recording and excerpt counts a row was in before it changes, locking it until the write commits"""
+    if raw:
+        return
+    instance._counted = counters.state(sender, instance.pk)
+
+
+@receiver(post_save, sender=Recording)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Recording)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Goal)
+def counted_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    after = counters.state(sender, instance.pk if kwargs['signal'] is post_save else None)
+    counters.moved(sender, getattr(instance, '_counted', counters.state(sender, None)), after)
+
+
+def loaded_fixtures():
+    """Do once, after `loaddata`, what the receivers above skip for each raw row
+
+    Every cached list is filed under PEOPLE. Counts, search entries and
+    practice rollups are left as the fixtures have them; reconcile_counts,
+    rebuild_search_index and rebuild_practice_stats recompute them.
+    """
+    bump(*VERSIONED)
+    invalidate(PEOPLE)
+
+
+# What the receivers above do for a new row, for rows written with bulk_create
+FAN_OUT = {
+    Comment: 'listenapi.tasks.fan_out_comment',
+    Recording: 'listenapi.tasks.fan_out_recording',
+}
+
+
+def created_in_bulk(model, instances):
+    """Do for rows created with bulk_create what post_save would have done for each"""
+    if not instances:
+        return
+    if model in FAN_OUT:
+        enqueue_many(FAN_OUT[model], [(instance.id,) for instance in instances])
+    if model in VERSIONED:
+        bump(model)
+    invalidate(*set().union(*(scopes_of(instance) for instance in instances)))
+    if model in search.KIND_OF:
+        search.index(model, [instance.pk for instance in instances])
+    if model is Recording:
+        practice.recorded_in_bulk(instances)
+    if model in counters.COUNTED:
+        counters.created_in_bulk(model, [instance.pk for instance in instances])
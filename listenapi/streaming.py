@@ -0,0 +1,38 @@
+"""Streaming JSON responses for full-history exports of list endpoints"""
+import json
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def wants_stream(request):
+    """True when the client asked for the whole list as a stream (?stream=1)"""
+    return request.query_params.get('stream') in ('1', 'true')
+
+
+def stream_list(view, queryset, render):
+    """Respond with every row of `queryset` as one JSON array, written incrementally
+
+    Rows are read in the view's ordering with a server-side iterator, so only
+    STREAM_CHUNK_SIZE of them are in memory at once no matter how long the
+    list is. `render` turns one row into its representation, for example a
+    Projection's `render`.
+    """
+    rows = queryset.order_by(*getattr(view, 'ordering', ('-id',))).iterator(
+        chunk_size=getattr(settings, 'STREAM_CHUNK_SIZE', 500))
+
+    return StreamingHttpResponse(
+        json_array(render(row) for row in rows),
+        content_type='application/json'
+    )
+
+
+def json_array(items):
+    """Encode an iterable as a JSON array one element at a time, like DRF's compact renderer"""
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    yield b'['
+    for index, item in enumerate(items):
+        if index:
+            yield b','
+        yield encoder.encode(item).encode('utf-8')
+    yield b']'
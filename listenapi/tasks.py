@@ -0,0 +1,29 @@
+"""Job functions queued with listenapi.jobs.enqueue
+
+Each takes ids rather than instances, reloads what it needs and does
+nothing if it has since been deleted. Each is safe to run more than once.
+"""
+from listenapi import feed, peaks
+from listenapi.models import Comment, Recording
+
+
+def fan_out_recording(recording_id):
+    recording = Recording.objects.select_related('excerpt').filter(pk=recording_id).first()
+    if recording is not None:
+        feed.fan_out_recording(recording)
+
+
+def fan_out_comment(comment_id):
+    comment = Comment.objects.filter(pk=comment_id).first()
+    if comment is not None:
+        feed.fan_out_comment(comment)
+
+
+def rebuild_timeline(follower_id):
+    feed.rebuild_timeline(follower_id)
+
+
+def analyse_recording(recording_id):
+    recording = Recording.objects.select_related('upload').filter(pk=recording_id).first()
+    if recording is not None:
+        peaks.analyse_recording(recording)
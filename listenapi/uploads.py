@@ -0,0 +1,128 @@
+"""Chunked, resumable audio uploads into content-addressed storage
+
+An upload session declares its size up front. The client then PUTs the file
+in chunks, each at the offset the server has received up to. A chunk is
+copied from the request body to a partial file on disk a block at a time,
+so it is never held in memory whole. After a dropped connection the bytes
+that made it to disk still count, and the client resumes from the offset
+GET /uploads/:id reports.
+
+Once every byte is in, the file is hashed and moved to
+MEDIA_ROOT/audio/<first two hex digits>/<sha256><extension>. A take that
+was uploaded before is not stored twice: the new upload just points at the
+existing file.
+
+Only one request writes an upload's partial file at a time: a chunk takes an
+exclusive lock on the file, then checks that the upload is still at its
+offset. A retried or duplicate chunk, such as a client resending after a
+timeout while the first attempt is still being written, gets a conflict
+rather than writing the same bytes twice.
+"""
+import fcntl
+import hashlib
+import os
+from pathlib import Path
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from listenapi.models import Upload
+
+
+def media_root():
+    return Path(settings.MEDIA_ROOT)
+
+
+def partial_path(upload):
+    """Where the bytes of an unfinished upload are written"""
+    return media_root() / 'uploads' / str(upload.id)
+
+
+def stored_name(sha256, filename):
+    """Storage path, relative to MEDIA_ROOT, of a finished file with this hash"""
+    extension = os.path.splitext(filename)[1].lower()
+    if not extension[1:].isalnum():
+        extension = ''
+    return f'audio/{sha256[:2]}/{sha256}{extension}'
+
+
+class ChunkConflict(Exception):
+    """Another chunk is being written, or the upload is no longer at this offset"""
+
+
+def receive_chunk(upload, offset, stream, length):
+    """Write up to `length` bytes of `stream` into the upload at `offset`
+
+    Returns how far the upload has been received afterwards. If the stream
+    ends early, for example because the client disconnected, whatever was
+    written is kept and the upload can be resumed from there. Raises
+    ChunkConflict, having written nothing, if another request holds the
+    upload or has already moved it past `offset`.
+    """
+    path = partial_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    block_size = getattr(settings, 'UPLOAD_BLOCK_SIZE', 64 * 1024)
+
+    # opened without truncating, so nothing is lost before the lock is held
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as partial:
+        try:
+            fcntl.flock(partial, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ChunkConflict()
+        # the lock is released when the file is closed
+        if not Upload.objects.filter(pk=upload.pk, received=offset, completed_on=None).exists():
+            if Upload.objects.filter(pk=upload.pk, completed_on__isnull=False).exists():
+                # finished meanwhile: the file opened above is a new, empty one
+                path.unlink()
+            raise ChunkConflict()
+
+        written = 0
+        # drop anything past `offset` left by a chunk that was never acknowledged
+        partial.seek(offset)
+        partial.truncate()
+        try:
+            while written < length:
+                block = stream.read(min(block_size, length - written))
+                if not block:
+                    break
+                partial.write(block)
+                written += len(block)
+        finally:
+            partial.flush()
+            os.fsync(partial.fileno())
+            # record what reached the disk even if reading the request failed
+            if written and not Upload.objects.filter(pk=upload.pk, received=offset).update(
+                    received=F('received') + written):
+                raise ChunkConflict()
+
+    upload.received = offset + written
+    return upload.received
+
+
+def finish(upload):
+    """Hash a fully received upload and move it into content-addressed storage"""
+    path = partial_path(upload)
+
+    digest = hashlib.sha256()
+    block_size = getattr(settings, 'UPLOAD_BLOCK_SIZE', 64 * 1024)
+    with open(path, 'rb') as partial:
+        for block in iter(lambda: partial.read(block_size), b''):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+
+    name = stored_name(sha256, upload.filename)
+    stored = media_root() / name
+    if stored.exists():
+        path.unlink()
+    else:
+        stored.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, stored)
+
+    upload.sha256 = sha256
+    upload.path = name
+    upload.completed_on = timezone.now()
+    upload.save(update_fields=['sha256', 'path', 'completed_on'])
+
+
+def url(upload):
+    """The URL a finished upload is served from, stored in Recording.audio"""
+    return settings.MEDIA_URL + upload.path
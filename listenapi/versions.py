@@ -0,0 +1,60 @@
+"""Version counters per table, and conditional GET built on them
+
+Every write to a versioned model bumps its table's counter (through the
+receivers in listenapi.signals, or an explicit `bump` where rows change
+without signals). A response's ETag hashes the counters of every table
+its payload reads, together with the request path, the representation
+asked for and the viewer. The ETag is therefore known from one primary-key
+lookup, before the view runs its own queries. An unchanged resource is
+answered with 304 Not Modified without being queried or serialized.
+"""
+import hashlib
+from django.db.models import F
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from listenapi.models import TableVersion
+
+
+def bump(*models):
+    """Mark the tables of `models` as changed"""
+    now = timezone.now()
+    for model in models:
+        name = model._meta.label_lower
+        if not TableVersion.objects.filter(name=name).update(version=F('version') + 1, updated_on=now):
+            _, created = TableVersion.objects.get_or_create(
+                name=name, defaults={'version': 1, 'updated_on': now})
+            if not created:
+                TableVersion.objects.filter(name=name).update(version=F('version') + 1, updated_on=now)
+
+
+def table_state(request, models):
+    """(ETag, Last-Modified) of the tables of `models` as seen by `request`, read once per request"""
+    state = getattr(request, '_table_state', None)
+    if state is None:
+        names = sorted(model._meta.label_lower for model in models)
+        versions = dict(
+            (name, (version, updated_on)) for name, version, updated_on in
+            TableVersion.objects.filter(name__in=names).values_list('name', 'version', 'updated_on')
+        )
+
+        key = [request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), str(request.user.pk)]
+        key += [f'{name}={versions.get(name, (0, None))[0]}' for name in names]
+        etag = hashlib.sha1('\n'.join(key).encode('utf-8')).hexdigest()
+
+        last_modified = max((updated_on for _, updated_on in versions.values()), default=None)
+
+        state = request._table_state = (etag, last_modified)
+    return state
+
+
+def conditional(*models):
+    """Give a viewset GET handler ETag and Last-Modified headers from the versions of `models`
+
+    `models` must include every model the response reads; If-None-Match
+    and If-Modified-Since are answered with 304 before the handler runs.
+    """
+    return method_decorator(condition(
+        etag_func=lambda request, *args, **kwargs: table_state(request, models)[0],
+        last_modified_func=lambda request, *args, **kwargs: table_state(request, models)[1]
+    ))
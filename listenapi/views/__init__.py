@@ -4,6 +4,10 @@ from .comment import Comments
 from .connection import Connections
 from .currentuser import CurrentUser
 from .excerpt import Excerpts
+from .feed import Feed
 from .goal import Goals
 from .musician import Musicians
-from .recording import Recordings
\ No newline at end of file
+from .reads import list_recordings, retrieve_recording
+from .recording import Recordings
+from .search import Search
+from .upload import Uploads
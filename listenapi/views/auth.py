@@ -1,49 +1,108 @@
-'''Handles the authentication of a user'''
+'''Handles the authentication of a user
+
+Login and registration are async views. Password hashing is deliberately
+slow, so it runs in a small dedicated thread pool while the event loop keeps
+serving other requests; database work goes through sync_to_async.
+'''
+import asyncio
 import json
-from django.http import HttpResponse, HttpResponseNotAllowed
-from django.contrib.auth import authenticate
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import User
-from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotAllowed
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from listenapi.models import Musician
 
 
+# PBKDF2 releases the GIL, so a few threads hash in parallel; bounding the
+# pool keeps a login burst from starving the rest of the process
+password_hasher = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PASSWORD_HASHER_THREADS', 4),
+    thread_name_prefix='password-hasher'
+)
+
+
+async def hash_in_pool(func, *args):
+    '''Run a password hashing function on the hasher pool'''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_hasher, func, *args)
+
+
+def find_login(username):
+    '''The active user with this username and their token, if they have one, or None'''
+    user = User.objects.select_related('auth_token').filter(username=username).first()
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def create_token(user):
+    '''The token of a user who has just logged in without one'''
+    # get_or_create, as two first logins can race
+    return Token.objects.get_or_create(user=user)[0]
+
+
+def create_musician(req_body, password):
+    '''Create the User, Musician and Token of a new account in one transaction'''
+    with transaction.atomic():
+        new_user = User.objects.create(
+            username=User.normalize_username(req_body['username']),
+            email=User.objects.normalize_email(req_body['email']),
+            password=password,
+            first_name=req_body['first_name'],
+            last_name=req_body['last_name']
+        )
+
+        Musician.objects.create(
+            bio=req_body['bio'],
+            user=new_user
+        )
 
-@csrf_exempt
-def login_user(request):
+        # Use the REST Framework's token generator on the new user account
+        return Token.objects.create(user=new_user)
+
+
+async def login_user(request):
     '''Handles the authentication of a musician
     Method arguments:
       request -- The full HTTP request object
     '''
 
+    # If the request is a HTTP POST, try to pull out the relevant information.
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(permitted_methods=['POST'])
+
     req_body = json.loads(request.body.decode())
+    username = req_body['username']
+    password = req_body['password']
 
-    # If the request is a HTTP POST, try to pull out the relevant information.
-    if request.method == 'POST':
-
-        # Use the built-in authenticate method to verify
-        username = req_body['username']
-        password = req_body['password']
-        authenticated_user = authenticate(username=username, password=password)
-
-        # If authentication was successful, respond with their token
-        if authenticated_user is not None:
-            token = Token.objects.get(user=authenticated_user)
-            data = json.dumps({"valid": True, "token": token.key})
-            return HttpResponse(data, content_type='application/json')
-
-        else:
-            # Bad login details were provided. So we can't log the user in.
-            data = json.dumps({"valid": False})
-            return HttpResponse(data, content_type='application/json')
-    
-    return HttpResponseNotAllowed(permitted_methods=['POST'])
+    user = await sync_to_async(find_login)(username)
 
+    if user is None:
+        # Hash anyway so unknown usernames take as long as wrong passwords
+        await hash_in_pool(make_password, password)
+        valid = False
+    else:
+        valid = await hash_in_pool(check_password, password, user.password)
 
-@csrf_exempt
-def register_user(request):
-    '''Handles the creation of a new gamer for authentication
+    # If authentication was successful, respond with their token
+    if valid:
+        # created only once the password is right, so a guess leaves no token behind
+        token = user.auth_token if hasattr(user, 'auth_token') else await sync_to_async(create_token)(user)
+        data = json.dumps({"valid": True, "token": token.key})
+    else:
+        # Bad login details were provided. So we can't log the user in.
+        data = json.dumps({"valid": False})
+
+    return HttpResponse(data, content_type='application/json')
+
+
+async def register_user(request):
+    '''Handles the creation of a new musician for authentication
     Method arguments:
       request -- The full HTTP request object
     '''
@@ -51,30 +110,19 @@ def register_user(request):
     # Load the JSON string of the request body into a dict
     req_body = json.loads(request.body.decode())
 
-    # Create a new user by invoking the `create_user` helper method
-    # on Django's built-in User model
-    new_user = User.objects.create_user(
-        username=req_body['username'],
-        email=req_body['email'],
-        password=req_body['password'],
-        first_name=req_body['first_name'],
-        last_name=req_body['last_name']
-    )
-
-    musician = Musician.objects.create(
-        bio=req_body['bio'],
-        user=new_user
-    )
-    #Save new musician to the database
-    musician.save()
-
-    # Use the REST Framework's token generator on the new user account
-    token = Token.objects.create(user=new_user)
+    password = await hash_in_pool(make_password, req_body['password'])
+    token = await sync_to_async(create_musician)(req_body, password)
 
     # Return the token to the client
     data = json.dumps({"token": token.key})
     return HttpResponse(data, content_type='application/json', status=status.HTTP_201_CREATED)
 
+
+# csrf_exempt wraps views in a sync function, which would hide that these are
+# coroutines, so mark them exempt directly
+login_user.csrf_exempt = True
+register_user.csrf_exempt = True
+
 #Patrick's profile and token
     
 #         {
@@ -4,19 +4,14 @@ from django.core.files.base import ContentFile
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework import status
 from listenapi.models import Category
+from listenapi.serializers import CATEGORY
+from listenapi.versions import conditional
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.parsers import MultiPartParser, FormParser
 
-class CategorySerializer(serializers.ModelSerializer):
-    """JSON serializer for categories"""
-    class Meta:
-        model = Category
-        fields = ('id', 'label')
-
 class Categories(ViewSet):
     """Request handlers for categories"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
@@ -48,8 +43,7 @@ class Categories(ViewSet):
 
             new_category.save()
 
-            serializer = CategorySerializer(new_category, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(CATEGORY.render_instance(new_category), status=status.HTTP_201_CREATED)
             
         except Exception as ex:
             return Response({'message': ex.args[0]})
@@ -94,9 +88,11 @@ class Categories(ViewSet):
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    @conditional(Category)
     def list(self, request):
         """
         @api {GET} /categories GET all categories
+        @apiParam {String} [fields] Comma-separated fields to return (label)
         @apiSuccess (200) {Object[]} comments Array of categories
         @apiSuccessExample {json} Success
             [
@@ -109,11 +105,10 @@ class Categories(ViewSet):
                 }
             ]
         """
-        categories = Category.objects.all()
+        projection = CATEGORY.for_request(request)
+        categories = projection.values(Category.objects.all())
 
-        serializer = CategorySerializer(
-            categories, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response(projection.render_many(categories))
 
         
 
@@ -3,54 +3,26 @@ import base64
 from django.core.files.base import ContentFile
 from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
-from rest_framework.viewsets import ViewSet
+from django.db import transaction
+from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework import status
+from listenapi import bulk
 from listenapi.models import Recording, Musician, Comment, Excerpt
+from listenapi.response_cache import cached_list
+from listenapi.serializers import COMMENT, viewer_is
+from listenapi.signals import created_in_bulk
+from listenapi.streaming import stream_list, wants_stream
+from listenapi.versions import conditional
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.parsers import MultiPartParser, FormParser
 from datetime import date
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ('id', 'first_name', 'last_name', 'email')
-
-class MusicianSerializer(serializers.ModelSerializer):
-    """Serializer for Musician info from a recording"""
-    user = UserSerializer(many=False)
-    class Meta:
-        model = Musician
-        fields = ('id', 'bio', 'user')
-
-class ExcerptSerializer(serializers.ModelSerializer):
-    """Serializer for excerpts"""
-    class Meta:
-        model = Excerpt
-        fields = ('id', 'name')
-
-class RecordingSerializer(serializers.ModelSerializer):
-    """JSON serializer for recordings"""
-    excerpt = ExcerptSerializer(many=False)
-    class Meta:
-        model = Recording
-        fields = ('audio', 'excerpt', 'date', 'label')
-        depth = 2
-
-class CommentSerializer(serializers.ModelSerializer):
-    """JSON serializer for comments"""
-    author = MusicianSerializer(many=False)
-    recording = RecordingSerializer(many=False)
-    class Meta:
-        model= Comment
-        fields= ('id', 'author', 'recording', 'date', 'content', 'created_by_current_user')
-        depth= 2
-
-class Comments(ViewSet):
+class Comments(GenericViewSet):
     """Request handlers for comments"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    ordering = ('-date', '-id')
 
     def create(self, request):
         """
@@ -111,18 +83,96 @@ class Comments(ViewSet):
             related_recording = Recording.objects.get(pk=request.data["recording"])
             new_comment.recording = related_recording
 
-            author = Musician.objects.get(user=request.auth.user)
+            author = request.user.musician
             new_comment.author = author
 
             new_comment.save()
+            new_comment.created_by_current_user = True
 
-            serializer = CommentSerializer(new_comment, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(COMMENT.render_instance(new_comment), status=status.HTTP_201_CREATED)
         
         except Exception as ex:
             return Response({'message': ex.args[0]})
         
 
+    @action(methods=['post'], detail=False)
+    def bulk(self, request):
+        """
+        @api {POST} /comments/bulk POST several new comments
+        @apiDescription Creates every valid comment of the array in one transaction,
+            authored by the current user. Invalid items are reported and the
+            rest are still created.
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiParam {Object[]} body Array of at most BULK_MAX_ITEMS comments, each as for POST /comments
+        @apiParamExample {json} Input
+            [
+                {
+                    "recording": 1,
+                    "content": "Make sure you can sing it before you play it"
+                },
+                {
+                    "recording": 2,
+                    "content": "Lovely phrasing in bar 12"
+                }
+            ]
+        @apiSuccess (200) {Object[]} results One per item, in request order
+        @apiSuccess (200) {Number} results.index Position of the item in the request
+        @apiSuccess (200) {Number} results.status 201 if the item was created, 400 if not
+        @apiSuccess (200) {Object} [results.comment] Created comment, as from POST /comments
+        @apiSuccess (200) {String} [results.message] Why the item was not created
+        @apiSuccessExample {json} Success
+            {
+                "results": [
+                    {
+                        "index": 0,
+                        "status": 201,
+                        "comment": {
+                            "id": 1,
+                            "author": {...},
+                            "recording": {...},
+                            "date": "2020-12-09",
+                            "content": "Make sure you can sing it before you play it",
+                            "created_by_current_user": true
+                        }
+                    },
+                    {
+                        "index": 1,
+                        "status": 400,
+                        "message": "No recording 2"
+                    }
+                ]
+            }
+        """
+        items = bulk.items_of(request)
+        author = request.user.musician
+
+        # one query for every recording the array refers to
+        recordings = Recording.objects.select_related('excerpt').in_bulk(bulk.ids_of(items, 'recording'))
+
+        entries = []
+        for item in items:
+            try:
+                entries.append(Comment(
+                    content=bulk.field(item, 'content'),
+                    date=date.today(),
+                    recording=bulk.related(item, 'recording', recordings),
+                    author=author
+                ))
+            except bulk.ItemError as ex:
+                entries.append(ex)
+
+        new_comments = [entry for entry in entries if isinstance(entry, Comment)]
+        with transaction.atomic():
+            bulk.insert(Comment, new_comments)
+            created_in_bulk(Comment, new_comments)
+
+        for new_comment in new_comments:
+            new_comment.created_by_current_user = True
+
+        return Response({'results': bulk.results(entries, 'comment', COMMENT.render_instance)})
+
     def update(self, request, pk=None):
         """
         @api {PUT} /comments/:id PUT changes to comment
@@ -140,7 +190,7 @@ class Comments(ViewSet):
         related_recording = Recording.objects.get(pk=request.data["recording"])
         comment.recording = related_recording
 
-        author = Musician.objects.get(user=request.auth.user)
+        author = request.user.musician
         comment.author = author
 
         comment.save()
@@ -170,85 +220,83 @@ class Comments(ViewSet):
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    @conditional(Comment, Recording, Excerpt, Musician, User)
+    @cached_list('recording', 'recording', per_viewer=True)
     def list(self, request):
         """
         @api {GET} /comments GET all comments
-        @apiSuccess (200) {Object[]} comments Array of comments
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (recording.label)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiParam {Number} [recording] Only comments on this recording
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Comments per page, at most MAX_PAGE_SIZE
+        @apiParam {Number} [stream] 1 to receive every matching comment as one streamed JSON array instead of a page
+        @apiSuccess (200) {String} next Link to the next (older) page, or null
+        @apiSuccess (200) {String} previous Link to the previous (newer) page, or null
+        @apiSuccess (200) {Object[]} results Array of comments, newest first
         @apiSuccessExample {json} Success
-            [
-                {
-                "id": 1,
-                "author": {
+            {
+                "next": "http://localhost:8000/comments?cursor=eyJwIjpbMV0sInIiOjB9",
+                "previous": null,
+                "results": [
+                    {
                     "id": 1,
-                    "bio": "violinist",
-                    "user": {
+                    "author": {
                         "id": 1,
-                        "username": "estherviolin"
-                    }
+                        "bio": "violinist",
+                        "user": {
+                            "id": 1,
+                            "username": "estherviolin"
+                        }
+
+                    },
+                    "recording": {
+                        "id": 1,
+                        "audio": "urlstring",
+                        "date": "2020-12-09"
+                        "label": "Mozart 5 take 1",
+                        "excerpt": {
+                            "name": "Mozart 5",
+                            "done": False,
+                            "musician": 1
+                        }
+                    },
+                    "date": "2020-12-09",
+                    "content": "Make sure you can sing it before you play it"
 
-                },
-                "recording": {
-                    "id": 1,
-                    "audio": "urlstring",
-                    "date": "2020-12-09"
-                    "label": "Mozart 5 take 1",
-                    "excerpt": {
-                        "name": "Mozart 5",
-                        "done": False,
-                        "musician": 1
                     }
-                },
-                "date": "2020-12-09",
-                "content": "Make sure you can sing it before you play it"
-                
-                }
-            ]
+                ]
+            }
         """
         comments = Comment.objects.all()
-        
-        for comment in comments:
-
-            comment.created_by_current_user = None
-
-            if comment.author.id == request.auth.user.id:
-                comment.created_by_current_user = True
-            else:
-                comment.created_by_current_user = False
 
         # Support filtering
         recording = self.request.query_params.get('recording', None)
 
         if recording is not None:
-            recording = Recording.objects.get(pk = recording)
-            comments = recording.recording_comment.all()
+            comments = comments.filter(recording_id=recording)
 
-            for comment in comments:
-                comment.created_by_current_user = None
+        projection = COMMENT.for_request(request, self)
+        comments = projection.values(comments.annotate(created_by_current_user=viewer_is(request, 'author_id')))
 
-                if comment.author.id == request.auth.user.id:
-                    comment.created_by_current_user = True
-                else:
-                    comment.created_by_current_user = False
-            
+        if wants_stream(request):
+            return stream_list(self, comments, projection.render)
 
-        serializer = CommentSerializer(
-            reversed(comments), many=True, context={'request': request})
-        return Response(serializer.data)
+        page = self.paginate_queryset(comments)
+        return self.get_paginated_response(projection.render_many(page))
 
+    @conditional(Comment, Recording, Excerpt, Musician, User)
     def retrieve(self, request, pk=None):
         """
         retrieve single comment by id
         """
 
         try:
-            comment = Comment.objects.get(pk=pk)
-            if comment.author.id == request.auth.user.id:
-                comment.created_by_current_user = True
-            else:
-                comment.created_by_current_user = False
-            serializer = CommentSerializer(comment, context={'request': request})
-            return Response(serializer.data)
-        except Excerpt.DoesNotExist as ex:
+            comments = Comment.objects.annotate(created_by_current_user=viewer_is(request, 'author_id'))
+            projection = COMMENT.for_request(request)
+            comment = projection.values(comments).get(pk=pk)
+            return Response(projection.render(comment))
+        except Comment.DoesNotExist as ex:
             return HttpResponseServerError(ex, status = status.HTTP_404_NOT_FOUND)
 
         
@@ -3,40 +3,19 @@ import base64
 from django.core.files.base import ContentFile
 from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
-from rest_framework.viewsets import ViewSet
+from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework import status
 from datetime import date
 from listenapi.models import Musician, Connection
+from listenapi.serializers import CONNECTION
+from listenapi.versions import conditional
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.parsers import MultiPartParser, FormParser
 from datetime import date
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ('id', 'first_name', 'last_name', 'email')
-
-class MusicianSerializer(serializers.ModelSerializer):
-    """Serializer for Musician info in a connection"""
-    user = UserSerializer(many=False)
-
-    class Meta:
-        model = Musician
-        fields = ('id', 'bio', 'user')
-
-class ConnectionSerializer(serializers.ModelSerializer):
-    """Serializer for connections"""
-    practicer = MusicianSerializer(many=False)
-    follower = MusicianSerializer(many=False)
-    class Meta:
-        model = Connection
-        fields = ('id', 'practicer', 'follower', 'created_on', 'ended_on')
-        depth = 2
-
-class Connections(ViewSet):
+class Connections(GenericViewSet):
     """Request handlers for excerpts"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
@@ -101,25 +80,51 @@ class Connections(ViewSet):
             related_practicer = Musician.objects.get(pk=request.data["practicer"])
             new_connection.practicer = related_practicer
 
-            related_follower = Musician.objects.get(user=request.auth.user)
+            related_follower = request.user.musician
             new_connection.follower = related_follower
 
             new_connection.save()
 
-            serializer = ConnectionSerializer(new_connection, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(CONNECTION.render_instance(new_connection), status=status.HTTP_201_CREATED)
         except Exception as ex:
             return Response({'message': ex.args[0]})
 
+    @conditional(Connection, Musician, User)
     def list(self, request):
+        """
+        @api {GET} /connections GET all connections
+        @apiParam {Number} [follower] Only connections made by this musician
+        @apiParam {Number} [practicer] Only connections to this musician
+        @apiParam {Number} [active] 1 for only connections that have not ended
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (follower.user.email)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Connections per page, at most MAX_PAGE_SIZE
+        @apiSuccess (200) {String} next Link to the next page, or null
+        @apiSuccess (200) {String} previous Link to the previous page, or null
+        @apiSuccess (200) {Object[]} results Array of connections, newest first
+        """
+
+        projection = CONNECTION.for_request(request, self)
+        connections = projection.values(Connection.objects.all())
+
+        # Support filtering, along the (follower, ended_on) and
+        # (practicer, ended_on) indexes
+        follower = request.query_params.get('follower', None)
+        practicer = request.query_params.get('practicer', None)
+
+        if follower is not None:
+            connections = connections.filter(follower_id=follower)
+
+        if practicer is not None:
+            connections = connections.filter(practicer_id=practicer)
 
-        connections = Connection.objects.all()
+        if request.query_params.get('active') in ('1', 'true'):
+            connections = connections.filter(ended_on=None)
 
-        # to do: filter by logged in user?
+        page = self.paginate_queryset(connections)
 
-        serializer = ConnectionSerializer(connections, many=True, context={'request': request})
-            
-        return Response(serializer.data)
+        return self.get_paginated_response(projection.render_many(page))
 
     def destroy(self, request, pk=None):
         """
@@ -146,7 +151,7 @@ class Connections(ViewSet):
 
             practicer = Musician.objects.get(pk=pk)
 
-            connection = Connection.objects.get(practicer=practicer, follower = request.auth.user.id, ended_on = None)
+            connection = Connection.objects.get(practicer=practicer, follower=request.user.musician, ended_on=None)
 
             connection.ended_on = date.today()
             connection.save()
@@ -3,20 +3,21 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
-from rest_framework import serializers, status
+from rest_framework import status
 from rest_framework.response import Response
 from listenapi.models import Musician
-from listenapi.views.musician import MusicianSerializer
+from listenapi.serializers import MUSICIAN_PROFILE
+from listenapi.versions import conditional
 
 class CurrentUser(ViewSet):
     """Musician Class"""
 
+    @conditional(Musician, User)
     def list(self, request):
         """ handles GET currently logged in user """
 
-        #the code in the parentheses is like a WHERE clause in SQL
-        user = Musician.objects.get(user=request.auth.user)
+        #not request.user.musician: the token cache may hold it from before a write
+        #in another process, which has already changed the ETag
+        user = Musician.objects.select_related('user').get(user_id=request.user.pk)
 
-        #imported the MusicianSerializer from musician.py to use in this module
-        serializer = MusicianSerializer(user, many=False, context={'request': request})
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(MUSICIAN_PROFILE.for_request(request).render_instance(user))
\ No newline at end of file
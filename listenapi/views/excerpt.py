@@ -3,37 +3,23 @@ import base64
 from django.core.files.base import ContentFile
 from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
-from rest_framework.viewsets import ViewSet
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework import status
-from listenapi.models import Excerpt, Musician
+from listenapi import practice
+from listenapi.models import Excerpt, Musician, Recording
+from listenapi.response_cache import cached_list, invalidate
+from listenapi.serializers import EXCERPT, viewer_is
+from listenapi.streaming import stream_list, wants_stream
+from listenapi.versions import bump, conditional
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.parsers import MultiPartParser, FormParser
+from datetime import date
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ('id', 'first_name', 'last_name', 'email')
-
-class MusicianSerializer(serializers.ModelSerializer):
-    """Serializer for Musician info from an excerpt"""
-    user = UserSerializer(many=False)
-
-    class Meta:
-        model = Musician
-        fields = ('id', 'bio', 'user')
-
-class ExcerptSerializer(serializers.ModelSerializer):
-    """Serializer for excerpts"""
-    musician = MusicianSerializer(many=False)
-    class Meta:
-        model = Excerpt
-        fields = ('id', 'name', 'musician', 'done', 'created_by_current_user')
-        depth = 2
-
-class Excerpts(ViewSet):
+class Excerpts(GenericViewSet):
     """Request handlers for excerpts"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
@@ -57,6 +43,8 @@ class Excerpts(ViewSet):
         @apiSuccess (200) {String} excerpt.name Name of excerpt
         @apiSuccess (200) {Number} excerpt.musician_id Associated musician
         @apiSuccess (200) {Boolean} excerpt.done Completed or not
+        @apiSuccess (200) {Number} excerpt.recording_count Recordings of the excerpt
+        @apiSuccess (200) {Number} excerpt.goal_count Goals on its recordings
         @apiSuccessExample {json} Success
             {
                 "id": 1,
@@ -80,25 +68,30 @@ class Excerpts(ViewSet):
             new_excerpt.name = request.data["name"]
             new_excerpt.done = request.data["done"]
 
-            related_musician = Musician.objects.get(user=request.auth.user)
+            related_musician = request.user.musician
             new_excerpt.musician = related_musician
 
             new_excerpt.save()
+            new_excerpt.created_by_current_user = True
 
-            serializer = ExcerptSerializer(new_excerpt, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(EXCERPT.render_instance(new_excerpt), status=status.HTTP_201_CREATED)
         except Exception as ex:
             return Response({'message': ex.args[0]})
 
+    @conditional(Excerpt, Musician, User)
     def retrieve(self, request, pk=None):
         """
         @api {GET} /excerpts/:id GET excerpt
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (name,musician.bio)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
         @apiParam {id} id Excerpt Id
         @apiSuccess (200) {Object} excerpt Created excerpt
         @apiSuccess (200) {id} excerpt.id Excerpt Id
         @apiSuccess (200) {String} excerpt.name Name of excerpt
         @apiSuccess (200) {Number} excerpt.musician_id Associated musician
         @apiSuccess (200) {Boolean} excerpt.done Completed or not
+        @apiSuccess (200) {Number} excerpt.recording_count Recordings of the excerpt
+        @apiSuccess (200) {Number} excerpt.goal_count Goals on its recordings
         @apiSuccessExample {json} Success
             {
                 "id": 1,
@@ -119,13 +112,10 @@ class Excerpts(ViewSet):
         """
 
         try:
-            excerpt = Excerpt.objects.get(pk=pk)
-            if excerpt.musician.id == request.auth.user.id:
-                excerpt.created_by_current_user = True
-            else:
-                excerpt.created_by_current_user = False
-            serializer = ExcerptSerializer(excerpt, context={'request': request})
-            return Response(serializer.data)
+            excerpts = Excerpt.objects.annotate(created_by_current_user=viewer_is(request, 'musician_id'))
+            projection = EXCERPT.for_request(request)
+            excerpt = projection.values(excerpts).get(pk=pk)
+            return Response(projection.render(excerpt))
         except Excerpt.DoesNotExist as ex:
             return HttpResponseServerError(ex, status = status.HTTP_404_NOT_FOUND)
 
@@ -143,7 +133,7 @@ class Excerpts(ViewSet):
         excerpt.name = request.data["name"]
         excerpt.done = request.data["done"]
 
-        related_musician = Musician.objects.get(user=request.auth.user)
+        related_musician = request.user.musician
         excerpt.musician = related_musician
         
         excerpt.save()
@@ -173,60 +163,61 @@ class Excerpts(ViewSet):
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    @conditional(Excerpt, Musician, User)
+    @cached_list('musician', 'musician', per_viewer=True)
     def list(self, request):
         """
         @api {GET} /excerpts GET all excerpts
-        @apiSuccess (200) {Object[]} excerpts Array of excerpts
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (name,musician.bio)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiParam {Number} [musician] Only this musician's excerpts
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Excerpts per page, at most MAX_PAGE_SIZE
+        @apiParam {Number} [stream] 1 to receive every matching excerpt as one streamed JSON array instead of a page
+        @apiSuccess (200) {String} next Link to the next (older) page, or null
+        @apiSuccess (200) {String} previous Link to the previous (newer) page, or null
+        @apiSuccess (200) {Object[]} results Array of excerpts, newest first
         @apiSuccessExample {json} Success
-            [
-                {
-                "id": 1,
-                "name": "Mozart 5",
-                "done": False,
-                "musician": {
+            {
+                "next": "http://localhost:8000/excerpts?cursor=eyJwIjpbMV0sInIiOjB9",
+                "previous": null,
+                "results": [
+                    {
                     "id": 1,
-                    "bio": "violinist",
-                    "user": {
+                    "name": "Mozart 5",
+                    "done": False,
+                    "musician": {
                         "id": 1,
-                        "first_name": "Esther",
-                        "last_name": "Sanders",
-                        "email": "esther@esther.com",
-                        "username": "estherviolin"
+                        "bio": "violinist",
+                        "user": {
+                            "id": 1,
+                            "first_name": "Esther",
+                            "last_name": "Sanders",
+                            "email": "esther@esther.com",
+                            "username": "estherviolin"
+                        }
                     }
                 }
+
+                ]
             }
-            
-            ]
         """
         excerpts = Excerpt.objects.all()
 
-        for excerpt in excerpts:
-
-            excerpt.created_by_current_user = None
-
-            if excerpt.musician.id == request.auth.user.id:
-                excerpt.created_by_current_user = True
-            else:
-                excerpt.created_by_current_user = False
-
         # Support filtering
         musician = self.request.query_params.get('musician', None)
-        
+
         if musician is not None:
-            musician = Musician.objects.get(pk=musician)
-            excerpts = excerpts.filter(musician=musician) 
+            excerpts = excerpts.filter(musician_id=musician)
 
-            for excerpt in excerpts:
-                excerpt.created_by_current_user = None
+        projection = EXCERPT.for_request(request, self)
+        excerpts = projection.values(excerpts.annotate(created_by_current_user=viewer_is(request, 'musician_id')))
 
-                if excerpt.musician.id == request.auth.user.id:
-                    excerpt.created_by_current_user = True
-                else:
-                    excerpt.created_by_current_user = False
+        if wants_stream(request):
+            return stream_list(self, excerpts, projection.render)
 
-        serializer = ExcerptSerializer(
-            reversed(excerpts), many=True, context={'request': request})
-        return Response(serializer.data)
+        page = self.paginate_queryset(excerpts)
+        return self.get_paginated_response(projection.render_many(page))
 
         
     #'done' custom action
@@ -240,9 +231,9 @@ class Excerpts(ViewSet):
             try:
                 excerpt.done = True
                 excerpt.save()
+                excerpt.created_by_current_user = excerpt.musician_id == request.user.musician.id
 
-                serializer = ExcerptSerializer(excerpt, context={'request': request})
-                return Response(serializer.data, status=status.HTTP_204_NO_CONTENT)
+                return Response(EXCERPT.render_instance(excerpt), status=status.HTTP_204_NO_CONTENT)
 
             except Excerpt.DoesNotExist:
                 return Response(
@@ -261,9 +252,9 @@ class Excerpts(ViewSet):
             try:
                 excerpt.done = False
                 excerpt.save()
+                excerpt.created_by_current_user = excerpt.musician_id == request.user.musician.id
 
-                serializer = ExcerptSerializer(excerpt, context={'request': request})
-                return Response(serializer.data, status=status.HTTP_204_NO_CONTENT)
+                return Response(EXCERPT.render_instance(excerpt), status=status.HTTP_204_NO_CONTENT)
 
             except Excerpt.DoesNotExist:
                 return Response(
@@ -271,7 +262,94 @@ class Excerpts(ViewSet):
                     status = status.HTTP_400_BAD_REQUEST
                 )
 
+    @action(methods=['put'], detail=False, url_path='done')
+    def done_many(self, request):
+        """
+        @api {PUT} /excerpts/done PUT several excerpts as done
+        @apiDescription Marks every matching excerpt of the current user as done
+            with a single UPDATE. Give ids, a filter, or both; excerpts of
+            other musicians are never changed.
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiParam {Number[]} [ids] Only these excerpts
+        @apiParam {Date} [recorded_before] Only excerpts whose latest recording is older than this date
+        @apiParam {Boolean} [all] true to match every excerpt of the current user
+        @apiParamExample {json} Input
+            {
+                "recorded_before": "2020-12-01"
+            }
+        @apiSuccess (200) {Number} updated How many excerpts changed
+        @apiSuccessExample {json} Success
+            {
+                "updated": 12
+            }
+        """
+        return self._set_done(request, True)
+
+    @action(methods=['put'], detail=False, url_path='undone')
+    def undone_many(self, request):
+        """
+        @api {PUT} /excerpts/undone PUT several excerpts as not done
+        @apiDescription As PUT /excerpts/done, marking the matching excerpts as not done.
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiParam {Number[]} [ids] Only these excerpts
+        @apiParam {Date} [recorded_before] Only excerpts whose latest recording is older than this date
+        @apiParam {Boolean} [all] true to match every excerpt of the current user
+        @apiSuccess (200) {Number} updated How many excerpts changed
+        @apiSuccessExample {json} Success
+            {
+                "updated": 3
+            }
+        """
+        return self._set_done(request, False)
+
+    def _set_done(self, request, done):
+        """Set `done` on the current user's excerpts matching the request body"""
+        musician = request.user.musician
+        excerpts = Excerpt.objects.filter(musician=musician)
 
+        ids = request.data.get("ids")
+        before = request.data.get("recorded_before")
+        if ids is None and before is None and request.data.get("all") is not True:
+            return Response(
+                {'message': 'Give ids, recorded_before or all'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
+        try:
+            if ids is not None:
+                excerpts = excerpts.filter(pk__in=[int(pk) for pk in ids])
+            if before is not None:
+                before = date.fromisoformat(before)
+                excerpts = excerpts.filter(
+                    Exists(Recording.objects.filter(excerpt=OuterRef('pk')))
+                ).exclude(
+                    Exists(Recording.objects.filter(excerpt=OuterRef('pk'), date__gte=before))
+                )
+        except (TypeError, ValueError) as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        # rows already in that state are left alone, so the count is of real changes
+        excerpts = excerpts.exclude(done=done)
+        with transaction.atomic():
+            if done:
+                today = date.today()
+                updated = excerpts.update(done=True, completed_on=today)
+                practice.record(musician.id, today, completed=updated)
+            else:
+                # the days they were completed on, to take them back off
+                completions = list(excerpts.filter(completed_on__isnull=False).values_list(
+                    'completed_on').annotate(count=Count('id')).order_by())
+                updated = excerpts.update(done=False, completed_on=None)
+                for day, count in completions:
+                    practice.record(musician.id, day, completed=-count)
+            if updated:
+                # .update() sends no signals; done only shows in the owner's excerpt lists
+                bump(Excerpt)
+                invalidate(('musician', musician.id))
+
+        return Response({'updated': updated})
 
-        
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""View module for handling requests about the follower feed"""
+from django.contrib.auth.models import User
+from rest_framework.viewsets import GenericViewSet
+from listenapi.models import Comment, Excerpt, FeedEntry, Musician, Recording
+from listenapi.serializers import FEED_ENTRY
+from listenapi.versions import conditional
+
+class Feed(GenericViewSet):
+    """Request handlers for the current musician's feed"""
+    ordering = ('-date', '-id')
+
+    @conditional(FeedEntry, Recording, Comment, Excerpt, Musician, User)
+    def list(self, request):
+        """
+        @api {GET} /feed GET recordings and comments by followed musicians
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (date,recording.label)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Entries per page, at most MAX_PAGE_SIZE
+        @apiSuccess (200) {String} next Link to the next (older) page, or null
+        @apiSuccess (200) {String} previous Link to the previous (newer) page, or null
+        @apiSuccess (200) {Object[]} results Feed entries, newest first; each has
+            either a recording or a comment
+        @apiSuccessExample {json} Success
+            {
+                "next": null,
+                "previous": null,
+                "results": [
+                    {
+                        "id": 7,
+                        "date": "2020-12-09",
+                        "musician": {
+                            "id": 2,
+                            "bio": "cellist",
+                            "user": {
+                                "id": 2,
+                                "first_name": "Patrick",
+                                "last_name": "Rush",
+                                "username": "patrickcello1"
+                            }
+                        },
+                        "recording": {
+                            "id": 1,
+                            "audio": "urlstring",
+                            "excerpt": {
+                                "id": 1,
+                                "name": "Mozart 5"
+                            },
+                            "date": "2020-12-09",
+                            "label": "Mozart 5 take 1"
+                        },
+                        "comment": null
+                    }
+                ]
+            }
+        """
+        follower = request.user.musician
+
+        # The follower's timeline is precomputed, so a page is one range
+        # scan of feedentry_follower_date_idx
+        projection = FEED_ENTRY.for_request(request, self)
+        entries = projection.values(FeedEntry.objects.filter(follower=follower))
+
+        page = self.paginate_queryset(entries)
+        return self.get_paginated_response(projection.render_many(page))
@@ -3,60 +3,22 @@ import base64
 from django.core.files.base import ContentFile
 from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
-from rest_framework.viewsets import ViewSet
+from django.db import transaction
+from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework import status
+from listenapi import bulk
 from listenapi.models import Excerpt, Recording, Musician, Goal, Category, category
+from listenapi.response_cache import CATEGORIES, cached_list
+from listenapi.serializers import GOAL
+from listenapi.signals import created_in_bulk
+from listenapi.streaming import stream_list, wants_stream
+from listenapi.versions import conditional
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.parsers import MultiPartParser, FormParser
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ('first_name', 'last_name', 'email')
-
-class MusicianSerializer(serializers.ModelSerializer):
-    """Serializer for Musician info from an excerpt"""
-    user = UserSerializer(many=False)
-    class Meta:
-        model = Musician
-        fields = ('id', 'bio', 'user')
-
-class ExcerptSerializer(serializers.ModelSerializer):
-    """Serializer for excerpts"""
-    musician = MusicianSerializer(many=False)
-    class Meta:
-        model = Excerpt
-        fields = ('id', 'name', 'musician')
-        depth = 1
-
-class RecordingSerializer(serializers.ModelSerializer):
-    """JSON serializer for recordings"""
-    excerpt = ExcerptSerializer(many=False)
-    class Meta:
-        model = Recording
-        fields = ('audio', 'excerpt', 'date', 'label')
-        depth = 1
-
-class CategorySerializer(serializers.ModelSerializer):
-    """JSON serializer for categories"""
-    class Meta:
-        model = Category
-        fields = ('id', 'label')
-
-class GoalSerializer(serializers.ModelSerializer):
-    """Serializer for goals"""
-    recording = RecordingSerializer(many=False)
-    category = CategorySerializer(many=False)
-    class Meta:
-        model = Goal
-        fields = ('id', 'recording', 'category', 'goal', 'action')
-
-    
-
-class Goals(ViewSet):
+class Goals(GenericViewSet):
     """Request handlers for goals"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
@@ -117,16 +79,99 @@ class Goals(ViewSet):
 
             new_goal.save()
 
-            serializer = GoalSerializer(new_goal, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(GOAL.render_instance(new_goal), status=status.HTTP_201_CREATED)
 
         except Exception as ex:
             return Response({'message': ex.args[0]})
         
 
+    @action(methods=['post'], detail=False)
+    def bulk(self, request):
+        """
+        @api {POST} /goals/bulk POST several new goals
+        @apiDescription Creates every valid goal of the array in one transaction.
+            Invalid items are reported and the rest are still created.
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiParam {Object[]} body Array of at most BULK_MAX_ITEMS goals, each as for POST /goals
+        @apiParamExample {json} Input
+            [
+                {
+                    "recording": 1,
+                    "category": 2,
+                    "goal": "F# perfectly in tune in measure 4",
+                    "action": "Start slow, sing in head, then get 3x in a row"
+                },
+                {
+                    "recording": 1,
+                    "category": 99,
+                    "goal": "Even sixteenths",
+                    "action": "Metronome on 2 and 4"
+                }
+            ]
+        @apiSuccess (200) {Object[]} results One per item, in request order
+        @apiSuccess (200) {Number} results.index Position of the item in the request
+        @apiSuccess (200) {Number} results.status 201 if the item was created, 400 if not
+        @apiSuccess (200) {Object} [results.goal] Created goal, as from POST /goals
+        @apiSuccess (200) {String} [results.message] Why the item was not created
+        @apiSuccessExample {json} Success
+            {
+                "results": [
+                    {
+                        "index": 0,
+                        "status": 201,
+                        "goal": {
+                            "id": 1,
+                            "recording": {...},
+                            "category": {
+                                "id": 2,
+                                "label": "intonation"
+                            },
+                            "goal": "F# perfectly in tune in measure 4",
+                            "action": "Start slow, sing in head, then get 3x in a row"
+                        }
+                    },
+                    {
+                        "index": 1,
+                        "status": 400,
+                        "message": "No category 99"
+                    }
+                ]
+            }
+        """
+        items = bulk.items_of(request)
+
+        # one query per related table for the whole array
+        recordings = Recording.objects.select_related('excerpt__musician__user').in_bulk(
+            bulk.ids_of(items, 'recording'))
+        categories = Category.objects.in_bulk(bulk.ids_of(items, 'category'))
+
+        entries = []
+        for item in items:
+            try:
+                entries.append(Goal(
+                    goal=bulk.field(item, 'goal'),
+                    action=bulk.field(item, 'action'),
+                    recording=bulk.related(item, 'recording', recordings),
+                    category=bulk.related(item, 'category', categories)
+                ))
+            except bulk.ItemError as ex:
+                entries.append(ex)
+
+        new_goals = [entry for entry in entries if isinstance(entry, Goal)]
+        with transaction.atomic():
+            bulk.insert(Goal, new_goals)
+            created_in_bulk(Goal, new_goals)
+
+        return Response({'results': bulk.results(entries, 'goal', GOAL.render_instance)})
+
+    @conditional(Goal, Recording, Excerpt, Musician, User, Category)
     def retrieve(self, request, pk=None):
         """
         @api {GET} /goals/:id GET goal
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (goal,category.label)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
         @apiParam {id} id Goal Id
         @apiSuccess (200) {Object} goal Created goal
         @apiSuccess (200) {id} goal.id Goal Id
@@ -159,9 +204,9 @@ class Goals(ViewSet):
         """
 
         try:
-            goal = Goal.objects.get(pk=pk)
-            serializer = GoalSerializer(goal, context={'request': request})
-            return Response(serializer.data)
+            projection = GOAL.for_request(request)
+            goal = projection.values(Goal.objects.all()).get(pk=pk)
+            return Response(projection.render(goal))
         except Goal.DoesNotExist as ex:
             return HttpResponseServerError(ex, status = status.HTTP_404_NOT_FOUND)
 
@@ -212,35 +257,49 @@ class Goals(ViewSet):
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    @conditional(Goal, Recording, Excerpt, Musician, User, Category)
+    @cached_list('recording', 'recording', CATEGORIES)
     def list(self, request):
         """
         @api {GET} /goals GET all goals
-        @apiSuccess (200) {Object[]} goals Array of goals
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (goal,category.label)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiParam {Number} [recording] Only goals for this recording
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Goals per page, at most MAX_PAGE_SIZE
+        @apiParam {Number} [stream] 1 to receive every matching goal as one streamed JSON array instead of a page
+        @apiSuccess (200) {String} next Link to the next (older) page, or null
+        @apiSuccess (200) {String} previous Link to the previous (newer) page, or null
+        @apiSuccess (200) {Object[]} results Array of goals, newest first
         @apiSuccessExample {json} Success
-            [
-                {
-                "id": 1,
-                "recording": {
-                    "id": 1,
-                    "audio": "urlstring",
-                    "date": "2020-12-09"
-                    "label": "Mozart 5 take 1",
-                    "excerpt": {
-                        "name": "Mozart 5",
-                        "done": False,
-                        "musician": 1
-                    }
-                },
-                "category": {
+            {
+                "next": "http://localhost:8000/goals?cursor=eyJwIjpbMV0sInIiOjB9",
+                "previous": null,
+                "results": [
+                    {
                     "id": 1,
-                    "label": "intonation"
-                },
-                "goal": "F# perfectly in tune in measure 4",
-                "action": "Start slow, sing in head, then get 3x in a row"
-            
+                    "recording": {
+                        "id": 1,
+                        "audio": "urlstring",
+                        "date": "2020-12-09"
+                        "label": "Mozart 5 take 1",
+                        "excerpt": {
+                            "name": "Mozart 5",
+                            "done": False,
+                            "musician": 1
+                        }
+                    },
+                    "category": {
+                        "id": 1,
+                        "label": "intonation"
+                    },
+                    "goal": "F# perfectly in tune in measure 4",
+                    "action": "Start slow, sing in head, then get 3x in a row"
+
+                }
+
+                ]
             }
-            
-            ]
         """
         goals = Goal.objects.all()
 
@@ -249,10 +308,15 @@ class Goals(ViewSet):
 
         if recording is not None:
             goals = goals.filter(recording=recording)
-        
-        serializer = GoalSerializer(
-            reversed(goals), many=True, context={'request': request})
-        return Response(serializer.data)
+
+        projection = GOAL.for_request(request, self)
+        goals = projection.values(goals)
+
+        if wants_stream(request):
+            return stream_list(self, goals, projection.render)
+
+        page = self.paginate_queryset(goals)
+        return self.get_paginated_response(projection.render_many(page))
 
         
 
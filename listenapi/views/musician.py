@@ -1,57 +1,443 @@
 """View module for handling requests about musicians"""
+from datetime import date, timedelta
+from django.conf import settings
 from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
-from rest_framework.viewsets import ViewSet
+from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.pagination import _positive_int
 from rest_framework import status
-from listenapi.models import Musician
+from listenapi import graph, practice
+from listenapi.models import Category, Comment, Connection, Excerpt, Goal, Musician, Recording
+from listenapi.serializers import (DASHBOARD_COMMENT, DASHBOARD_EXCERPT, DASHBOARD_GOAL, DASHBOARD_RECORDING,
+                                   FOLLOWER, FOLLOWING, MUSICIAN_PROFILE, PRACTICE_DAY, PRACTICE_STATS, SUGGESTION,
+                                   Projection, requested_fields, viewer_is)
+from listenapi.versions import conditional
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ('first_name', 'last_name', 'username', 'email')
+# what the dashboard still selects of a musician whose fields were all left out
+MUSICIAN_ID = Projection('id')
 
-class MusicianSerializer(serializers.ModelSerializer):
-    """Serializer for Musicians"""
-    user = UserSerializer(many=False)
 
-    class Meta:
-        model = Musician
-        fields = ('id', 'bio', 'user', 'is_current_user')
+def dashboard_parts(fields, expand):
+    """The projections of each part of a dashboard, pruned by ?fields= and ?expand=
 
-class Musicians(ViewSet):
+    Their paths start with the part they prune (musician.bio, excerpts.name,
+    recordings.label, recordings.goals.goal). With ?fields=, a part it does
+    not name is None: left out of the response and not queried. ValueError
+    for a path that names no field.
+    """
+    parts = {'musician': MUSICIAN_PROFILE, 'excerpts': DASHBOARD_EXCERPT, 'recordings': DASHBOARD_RECORDING,
+             'goals': DASHBOARD_GOAL, 'comments': DASHBOARD_COMMENT}
+    if fields is None and expand is None:
+        return parts
+
+    def prune(projection, fields, expand, path, hidden):
+        name = path.split('.')[-1]
+        if fields is not None and name not in fields:
+            return None
+        inner = (fields or {}).get(name) or None
+        nested = expand.get(name, {})
+        if name == 'recordings':
+            inner = inner and {key: tree for key, tree in inner.items() if key not in ('goals', 'comments')}
+            nested = {key: tree for key, tree in nested.items() if key not in ('goals', 'comments')}
+        pruned = projection.select(inner or None, nested, path + '.')
+        # the columns the view reads besides what it renders
+        pruned.hidden = hidden
+        return pruned
+
+    for tree in (fields or {}, expand):
+        for name in tree:
+            if name not in ('musician', 'excerpts', 'recordings'):
+                raise ValueError(f'Unknown field {name}')
+    pruned = {
+        'musician': prune(MUSICIAN_PROFILE, fields, expand, 'musician', ('id',)),
+        'excerpts': prune(DASHBOARD_EXCERPT, fields, expand, 'excerpts', ()),
+        'recordings': prune(DASHBOARD_RECORDING, fields, expand, 'recordings', ('id',)),
+    }
+    recording_fields = None if fields is None else fields.get('recordings') or None
+    recording_expand = expand.get('recordings', {})
+    for name in ('goals', 'comments'):
+        pruned[name] = None if pruned['recordings'] is None else prune(
+            parts[name], recording_fields, recording_expand, f'recordings.{name}', ('recording',))
+    return pruned
+
+
+class Musicians(GenericViewSet):
     """Request handlers for musicians"""
+    ordering = ('id',)
 
+    @conditional(Musician, User)
     def list(self, request):
-        """ handles GET all"""
-        musicians = Musician.objects.all()
+        """ handles GET all, one page at a time in id order"""
+        projection = MUSICIAN_PROFILE.for_request(request, self)
+        musicians = projection.values(Musician.objects.all())
 
-        serializer = MusicianSerializer(musicians, many=True, context={'request': request})
-        return Response(serializer.data)
+        page = self.paginate_queryset(musicians)
+        return self.get_paginated_response(projection.render_many(page))
 
+    @conditional(Musician, User, Connection)
     def retrieve(self, request, pk=None):
         """Handle GET requests for single musician
         Returns:
             Response -- JSON serialized musician instance
         """
        
+        projection = MUSICIAN_PROFILE.for_request(request)
+
         try:
-            musician = Musician.objects.get(pk=pk)
-            
-            #logic to set an unmapped property on Musician
-            #will let front end determine if the Musicianretrieved by this function is the current user
-
-            if request.auth.user.id == int(pk):
-                musician.is_current_user = True
-            else:
-                musician.is_current_user = False
-
-            serializer = MusicianSerializer(musician, context={'request': request})
-            return Response(serializer.data)
+            #annotate an unmapped property on Musician
+            #will let front end determine if the Musician retrieved by this function is the current user
+            musicians = Musician.objects.annotate(
+                is_current_user=viewer_is(request, 'id'),
+                is_following=graph.viewer_follows(request)
+            )
+
+            musician = projection.values(musicians).get(pk=pk)
+            return Response(projection.render(musician))
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @action(methods=['get'], detail=True)
+    @conditional(Musician, User, Excerpt, Recording, Goal, Comment, Category)
+    def dashboard(self, request, pk=None):
+        """
+        @api {GET} /musicians/:id/dashboard GET a musician's profile page in one request
+        @apiDescription The musician, all of their excerpts, their most recent
+            recordings, and the goals and comments on those recordings. Loaded
+            with five queries however many recordings are included.
+        @apiParam {id} id Musician Id
+        @apiParam {Number} [recordings=10] How many recent recordings to include, at most MAX_PAGE_SIZE
+        @apiParam {String} [fields] Comma-separated fields to return, each under its part of the
+            response (musician.bio,excerpts.name,recordings.label,recordings.goals.goal); parts
+            not named are left out
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids,
+            also under their part (recordings.excerpt,recordings.comments.author)
+        @apiSuccess (200) {Object} musician The musician, as from GET /musicians/:id
+        @apiSuccess (200) {Object[]} excerpts Their excerpts, newest first
+        @apiSuccess (200) {Object[]} recordings Their most recent recordings, newest first
+        @apiSuccess (200) {Object[]} recordings.goals Goals on the recording, newest first
+        @apiSuccess (200) {Object[]} recordings.comments Comments on the recording, newest first
+        @apiSuccessExample {json} Success
+            {
+                "musician": {
+                    "id": 1,
+                    "bio": "violinist",
+                    "user": {...},
+                    "is_current_user": true
+                },
+                "excerpts": [
+                    {
+                        "id": 1,
+                        "name": "Mozart 5",
+                        "done": false,
+                        "created_by_current_user": true
+                    }
+                ],
+                "recordings": [
+                    {
+                        "id": 1,
+                        "audio": "urlstring",
+                        "excerpt": {
+                            "id": 1,
+                            "name": "Mozart 5"
+                        },
+                        "date": "2020-12-09",
+                        "label": "Mozart 5 take 1",
+                        "duration": null,
+                        "sample_rate": null,
+                        "channels": null,
+                        "goals": [
+                            {
+                                "id": 1,
+                                "recording": 1,
+                                "category": {
+                                    "id": 1,
+                                    "label": "intonation"
+                                },
+                                "goal": "F# perfectly in tune in measure 4",
+                                "action": "Start slow, sing in head, then get 3x in a row"
+                            }
+                        ],
+                        "comments": [
+                            {
+                                "id": 1,
+                                "recording": 1,
+                                "author": {...},
+                                "date": "2020-12-09",
+                                "content": "Make sure you can sing it before you play it",
+                                "created_by_current_user": false
+                            }
+                        ]
+                    }
+                ]
+            }
+        """
+        try:
+            limit = _positive_int(request.query_params.get('recordings', 10), strict=True,
+                                  cutoff=getattr(settings, 'MAX_PAGE_SIZE', 100))
+        except ValueError:
+            return Response({'message': 'recordings must be a positive number'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            parts = dashboard_parts(*requested_fields(request))
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        musicians = Musician.objects.annotate(is_current_user=viewer_is(request, 'id'))
+        try:
+            musician = (parts['musician'] or MUSICIAN_ID).values(musicians).get(pk=pk)
+        except (Musician.DoesNotExist, ValueError) as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        dashboard = {}
+        if parts['musician'] is not None:
+            dashboard['musician'] = parts['musician'].render(musician)
+        if parts['excerpts'] is not None:
+            excerpts = parts['excerpts'].values(
+                Excerpt.objects.filter(musician_id=musician['id'])
+                .annotate(created_by_current_user=viewer_is(request, 'musician_id'))
+                .order_by('-id')
+            )
+            dashboard['excerpts'] = parts['excerpts'].render_many(excerpts)
+        if parts['recordings'] is None:
+            return Response(dashboard)
+
+        # one query each for the goals and comments of every recording shown,
+        # grouped under their recording here
+        by_id = {}
+        dashboard['recordings'] = []
+        for row in parts['recordings'].values(
+            Recording.objects.filter(excerpt__musician_id=musician['id']).order_by('-date', '-id')[:limit]
+        ):
+            recording = parts['recordings'].render(row)
+            for name in ('goals', 'comments'):
+                if parts[name] is not None:
+                    recording[name] = []
+            by_id[row['id']] = recording
+            dashboard['recordings'].append(recording)
+
+        if parts['goals'] is not None:
+            goals = parts['goals'].values(Goal.objects.filter(recording_id__in=by_id).order_by('-id'))
+            for goal in goals:
+                by_id[goal['recording']]['goals'].append(parts['goals'].render(goal))
+
+        if parts['comments'] is not None:
+            comments = parts['comments'].values(
+                Comment.objects.filter(recording_id__in=by_id)
+                .annotate(created_by_current_user=viewer_is(request, 'author_id'))
+                .order_by('-date', '-id')
+            )
+            for comment in comments:
+                by_id[comment['recording']]['comments'].append(parts['comments'].render(comment))
+
+        return Response(dashboard)
+
+    @action(methods=['get'], detail=True)
+    @conditional(Connection, Musician, User)
+    def followers(self, request, pk=None):
+        """
+        @api {GET} /musicians/:id/followers GET who follows a musician
+        @apiParam {id} id Musician Id
+        @apiParam {Number} [musician] Only this follower: an empty page means they do not follow
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (follower.user.email)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Followers per page, at most MAX_PAGE_SIZE
+        @apiSuccess (200) {Object[]} results Active connections, most recent first
+        @apiSuccess (200) {id} results.id Connection Id
+        @apiSuccess (200) {Object} results.follower The following musician
+        @apiSuccess (200) {Date} results.created_on When they followed
+        """
+        return self.connections(request, FOLLOWER, practicer_id=pk, other='follower_id')
+
+    @action(methods=['get'], detail=True)
+    @conditional(Connection, Musician, User)
+    def following(self, request, pk=None):
+        """
+        @api {GET} /musicians/:id/following GET who a musician follows
+        @apiParam {id} id Musician Id
+        @apiParam {Number} [musician] Only this musician: an empty page means they are not followed
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (practicer.user.email)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Musicians per page, at most MAX_PAGE_SIZE
+        @apiSuccess (200) {Object[]} results Active connections, most recent first
+        @apiSuccess (200) {id} results.id Connection Id
+        @apiSuccess (200) {Object} results.practicer The followed musician
+        @apiSuccess (200) {Date} results.created_on When they were followed
+        """
+        return self.connections(request, FOLLOWING, follower_id=pk, other='practicer_id')
+
+    def connections(self, request, projection, other, **end):
+        """A page of one end's active connections, read along (end, ended_on)
+
+        `projection` is pruned by the request's ?fields= and ?expand=, which
+        raise ParseError (400) when they name unknown fields.
+        """
+        # newest connection first, rather than the musician list's id order
+        self.ordering = ('-id',)
+        try:
+            connections = Connection.objects.filter(ended_on=None, **end)
+            if 'musician' in request.query_params:
+                connections = connections.filter(**{other: int(request.query_params['musician'])})
+            projection = projection.for_request(request, self)
+            rows = projection.values(connections)
+            page = self.paginate_queryset(rows)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return self.get_paginated_response(projection.render_many(page))
+
+    @action(methods=['get'], detail=True)
+    @conditional(Connection, Musician, User)
+    def suggestions(self, request, pk=None):
+        """
+        @api {GET} /musicians/:id/suggestions GET musicians to follow
+        @apiDescription Musicians followed by the ones this musician follows, whom
+            they do not follow yet, ranked by how many of those follow them. At
+            most SUGGESTION_LIMIT, cached per musician until they follow or
+            unfollow someone.
+        @apiParam {id} id Musician Id
+        @apiParam {String} [fields] Comma-separated fields of each suggestion to return (mutual,musician.user.id)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiSuccess (200) {Object[]} results Suggestions, best first
+        @apiSuccess (200) {Object} results.musician The suggested musician
+        @apiSuccess (200) {Number} results.mutual How many followed musicians follow them
+        @apiSuccessExample {json} Success
+            {
+                "results": [
+                    {
+                        "musician": {
+                            "id": 3,
+                            "bio": "cellist",
+                            "user": {...}
+                        },
+                        "mutual": 2
+                    }
+                ]
+            }
+        """
+        if not self.musician_exists(pk):
+            return Response({'message': 'Musician does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        suggestion = SUGGESTION.for_request(request)
+        musician = dict(suggestion.fields).get('musician')
+        ranked = graph.suggestions(int(pk))
+
+        if musician is None:
+            # left out or rendered as its id: nothing to look up
+            profiles = {musician_id: musician_id for musician_id, _ in ranked}
+        else:
+            musician = musician.selecting('id')
+            profiles = {
+                row['id']: musician.render(row)
+                for row in musician.values(Musician.objects.filter(pk__in=[pk for pk, _ in ranked]))
+            }
+
+        results = []
+        for musician_id, mutual in ranked:
+            if musician_id in profiles:
+                found = {'musician': profiles[musician_id], 'mutual': mutual}
+                results.append({name: found[name] for name, _ in suggestion.fields})
+        return Response({'results': results})
+
+    # Neither stats nor heatmap is @conditional: what they return changes
+    # with the date as well as with the tables
+
+    @action(methods=['get'], detail=True)
+    def stats(self, request, pk=None):
+        """
+        @api {GET} /musicians/:id/stats GET practice statistics
+        @apiDescription Answered from the musician's daily practice rollups.
+            A streak is a run of consecutive days with at least one recording,
+            still current if the last one was today or yesterday.
+        @apiParam {id} id Musician Id
+        @apiParam {Number} [weeks=12] Weeks in the weekly series, up to this week
+        @apiParam {Number} [months=12] Months in the monthly series, up to this month
+        @apiParam {String} [fields] Comma-separated fields to return (current_streak,weeks)
+        @apiSuccess (200) {Number} recordings Recordings ever made
+        @apiSuccess (200) {Number} completed Excerpts finished, by the day they were marked done
+        @apiSuccess (200) {Number} days_practiced Days with at least one recording
+        @apiSuccess (200) {Date} last_practiced Most recent of those days, or null
+        @apiSuccess (200) {Number} current_streak Days in the current streak
+        @apiSuccess (200) {Number} longest_streak Days in the longest streak
+        @apiSuccess (200) {Object[]} weeks Recordings and days practiced per week, from Monday
+        @apiSuccess (200) {Object[]} months Recordings and excerpts completed per month
+        @apiSuccessExample {json} Success
+            {
+                "recordings": 57,
+                "completed": 4,
+                "days_practiced": 31,
+                "last_practiced": "2020-12-09",
+                "current_streak": 3,
+                "longest_streak": 11,
+                "weeks": [
+                    {"week": "2020-12-07", "recordings": 5, "days": 3}
+                ],
+                "months": [
+                    {"month": "2020-12", "recordings": 12, "completed": 1}
+                ]
+            }
+        """
+        try:
+            weeks = _positive_int(request.query_params.get('weeks', 12), strict=True, cutoff=520)
+            months = _positive_int(request.query_params.get('months', 12), strict=True, cutoff=120)
+        except ValueError:
+            return Response({'message': 'weeks and months must be positive numbers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if not self.musician_exists(pk):
+            return Response({'message': 'Musician does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        projection = PRACTICE_STATS.for_request(request)
+        return Response(projection.render(practice.stats(pk, date.today(), weeks, months)))
+
+    @action(methods=['get'], detail=True)
+    def heatmap(self, request, pk=None):
+        """
+        @api {GET} /musicians/:id/heatmap GET daily practice for a calendar heatmap
+        @apiParam {id} id Musician Id
+        @apiParam {Date} [from] First day, a year before `to` by default
+        @apiParam {Date} [to] Last day, today by default
+        @apiParam {String} [fields] Comma-separated fields of each day to return (date,recordings)
+        @apiSuccess (200) {Date} from First day covered
+        @apiSuccess (200) {Date} to Last day covered
+        @apiSuccess (200) {Object[]} days Only the days with any recordings or completed excerpts, oldest first
+        @apiSuccessExample {json} Success
+            {
+                "from": "2019-12-10",
+                "to": "2020-12-09",
+                "days": [
+                    {"date": "2020-12-08", "recordings": 2, "completed": 0},
+                    {"date": "2020-12-09", "recordings": 1, "completed": 1}
+                ]
+            }
+        """
+        try:
+            end = date.fromisoformat(request.query_params.get('to', date.today().isoformat()))
+            start = request.query_params.get('from')
+            start = date.fromisoformat(start) if start else end - timedelta(days=364)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        if start > end:
+            return Response({'message': 'from must not be after to'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not self.musician_exists(pk):
+            return Response({'message': 'Musician does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        projection = PRACTICE_DAY.for_request(request)
+        days = projection.values(practice.heatmap(pk, start, end))
+        return Response({'from': start, 'to': end, 'days': projection.render_many(days)})
+
+    @staticmethod
+    def musician_exists(pk):
+        try:
+            return Musician.objects.filter(pk=pk).exists()
+        except ValueError:
+            return False
+
     def update(self, request, pk=None):
         """
         @api {PUT} /musicians/:id PUT changes to musician profile
@@ -69,6 +455,7 @@ class Musicians(ViewSet):
         musician.user.email = request.data["email"]
         
         musician.user.save()
-        musician.save()
+        # never write the connection counts back; listenapi.graph owns them
+        musician.save(update_fields=['bio'])
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
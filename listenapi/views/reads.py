@@ -0,0 +1,225 @@
+'''Async variants of the recording read endpoints, served under /async
+
+Django 3.1 has no async ORM, so every query runs on a worker thread of its
+own through sync_to_async, and the independent queries of one request are
+awaited together with asyncio.gather. A request then takes about as long as
+its slowest query rather than all of them in turn, and under ASGI the event
+loop serves other requests meanwhile. The queries that need the viewer
+authenticate on their own thread through request.user, so no other query
+waits for authentication.
+
+The viewsets' ETags and response cache wrap their sync handlers, so these
+views answer every request in full.
+'''
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from listenapi.models import Comment, Excerpt, Goal, Musician, Recording
+from listenapi.serializers import DASHBOARD_COMMENT, DASHBOARD_GOAL, EXCERPT, MUSICIAN, RECORDING, viewer_is
+from .comment import Comments
+from .recording import Recordings
+
+
+def in_thread(func):
+    '''`func` as a coroutine function that runs on a worker thread of its own
+
+    Each worker thread keeps its own connection. As request_started and
+    request_finished do for a request's thread, it is closed before and
+    after if it failed or outlived CONN_MAX_AGE.
+    '''
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def api_request(request):
+    '''The DRF request around `request`, authenticated as the viewsets are'''
+    return Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def query_ids(request, *names):
+    '''The ids in the query parameters `names`, None where absent; ValueError if one is not a number'''
+    return [None if request.query_params.get(name) is None else int(request.query_params[name])
+            for name in names]
+
+
+def page_of_recordings(request, projection, excerpt_id, musician_id):
+    recordings = projection.values(Recording.objects.all())
+    if excerpt_id is not None:
+        recordings = recordings.filter(excerpt_id=excerpt_id)
+    if musician_id is not None:
+        recordings = recordings.filter(excerpt__musician_id=musician_id)
+
+    paginator = Recordings.pagination_class()
+    page = paginator.paginate_queryset(recordings, request, Recordings)
+    return paginator.get_paginated_response(projection.render_many(page)).data
+
+
+def find_excerpt(request, excerpt_id):
+    excerpts = EXCERPT.values(Excerpt.objects.annotate(created_by_current_user=viewer_is(request, 'musician_id')))
+    row = excerpts.filter(pk=excerpt_id).first()
+    return None if row is None else EXCERPT.render(row)
+
+
+def find_musician(musician_id):
+    row = MUSICIAN.values(Musician.objects.filter(pk=musician_id)).first()
+    return None if row is None else MUSICIAN.render(row)
+
+
+def find_recording(recording_id):
+    row = RECORDING.values(Recording.objects.filter(pk=recording_id)).first()
+    return None if row is None else RECORDING.render(row)
+
+
+def comments_on(request, recording_id):
+    comments = Comment.objects.filter(recording_id=recording_id).annotate(
+        created_by_current_user=viewer_is(request, 'author_id'))
+    newest = DASHBOARD_COMMENT.values(comments).order_by(*Comments.ordering)[:settings.MAX_PAGE_SIZE]
+    return DASHBOARD_COMMENT.render_many(newest)
+
+
+def goals_on(recording_id):
+    goals = Goal.objects.filter(recording_id=recording_id)
+    newest = DASHBOARD_GOAL.values(goals).order_by('-id')[:settings.MAX_PAGE_SIZE]
+    return DASHBOARD_GOAL.render_many(newest)
+
+
+async def list_recordings(request):
+    '''
+    @api {GET} /async/recordings GET all recordings, querying concurrently
+    @apiDescription As GET /recordings, without ?stream=. The excerpt and the musician
+        that the filters name are looked up while the page is queried, and returned with it.
+    @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (label,excerpt.name)
+    @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+    @apiParam {Number} [excerpt] Only recordings of this excerpt
+    @apiParam {Number} [musician] Only recordings of this musician's excerpts
+    @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+    @apiParam {Number} [page_size=10] Recordings per page, at most MAX_PAGE_SIZE
+    @apiSuccess (200) {String} next Link to the next (older) page, or null
+    @apiSuccess (200) {String} previous Link to the previous (newer) page, or null
+    @apiSuccess (200) {Object[]} results Array of recordings, newest first
+    @apiSuccess (200) {Object} [excerpt] The filtered excerpt, as from GET /excerpts/:id
+    @apiSuccess (200) {Object} [musician] The filtered musician, with their user
+    @apiError (404) {String} message The excerpt or musician filtered on does not exist
+    '''
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(permitted_methods=['GET'])
+
+    request = api_request(request)
+    try:
+        excerpt_id, musician_id = query_ids(request, 'excerpt', 'musician')
+    except ValueError:
+        return json_response({'message': 'excerpt and musician must be ids'}, status.HTTP_400_BAD_REQUEST)
+
+    def recordings(projection):
+        if excerpt_id is None:
+            # else find_excerpt authenticates; either way a bad token fails the list, as in the viewset
+            request.user
+        return page_of_recordings(request, projection, excerpt_id, musician_id)
+
+    async def excerpt():
+        if excerpt_id is None:
+            return None
+        return await in_thread(find_excerpt)(request, excerpt_id)
+
+    async def musician():
+        if musician_id is None:
+            return None
+        return await in_thread(find_musician)(musician_id)
+
+    try:
+        projection = RECORDING.for_request(request, Recordings)
+        page, found_excerpt, found_musician = await asyncio.gather(
+            in_thread(recordings)(projection), excerpt(), musician()
+        )
+    except APIException as ex:
+        return json_response({'detail': ex.detail}, ex.status_code)
+
+    if excerpt_id is not None:
+        if found_excerpt is None:
+            return json_response({'message': 'Excerpt matching query does not exist.'}, status.HTTP_404_NOT_FOUND)
+        page['excerpt'] = found_excerpt
+    if musician_id is not None:
+        if found_musician is None:
+            return json_response({'message': 'Musician matching query does not exist.'}, status.HTTP_404_NOT_FOUND)
+        page['musician'] = found_musician
+    return json_response(page)
+
+
+async def retrieve_recording(request, pk):
+    '''
+    @api {GET} /async/recordings/:id GET recording with its comments and goals
+    @apiDescription The recording as from GET /recordings/:id, with its comments and goals
+        in the same response. The three are queried concurrently.
+    @apiParam {id} id Recording Id
+    @apiSuccess (200) {Object} recording The recording, as from GET /recordings/:id
+    @apiSuccess (200) {Object[]} comments Its newest comments, at most MAX_PAGE_SIZE; the
+        recording's comment_count tells whether there are more
+    @apiSuccess (200) {Object[]} goals Its newest goals, at most MAX_PAGE_SIZE
+    @apiSuccessExample {json} Success
+        {
+            "recording": {
+                "id": 1,
+                "audio": "urlstring",
+                "excerpt": {...},
+                "date": "2020-12-09",
+                "label": "Mozart 5 take 1",
+                ...
+                "comment_count": 1,
+                "goal_count": 1
+            },
+            "comments": [
+                {
+                    "id": 1,
+                    "recording": 1,
+                    "author": {...},
+                    "date": "2020-12-09",
+                    "content": "Make sure you can sing it before you play it",
+                    "created_by_current_user": false
+                }
+            ],
+            "goals": [
+                {
+                    "id": 1,
+                    "recording": 1,
+                    "category": {
+                        "id": 1,
+                        "label": "intonation"
+                    },
+                    "goal": "F# perfectly in tune in measure 4",
+                    "action": "Start slow, sing in head, then get 3x in a row"
+                }
+            ]
+        }
+    @apiError (404) {String} message No recording has this id
+    '''
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(permitted_methods=['GET'])
+
+    request = api_request(request)
+
+    try:
+        recording, found_comments, found_goals = await asyncio.gather(
+            in_thread(find_recording)(pk), in_thread(comments_on)(request, pk), in_thread(goals_on)(pk)
+        )
+    except APIException as ex:
+        return json_response({'detail': ex.detail}, ex.status_code)
+
+    if recording is None:
+        return json_response({'message': 'Recording matching query does not exist.'}, status.HTTP_404_NOT_FOUND)
+    return json_response({'recording': recording, 'comments': found_comments, 'goals': found_goals})
@@ -1,48 +1,31 @@
 """View module for handling requests about recordings"""
 import base64
+from uuid import UUID
 from django.core.files.base import ContentFile
-from django.http import HttpResponseServerError
+from django.http import FileResponse, HttpResponseServerError
 from django.contrib.auth.models import User
-from rest_framework.viewsets import ViewSet
+from django.db import transaction
+from rest_framework.viewsets import GenericViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework import status
-from listenapi.models import Recording, Excerpt, Musician
+from listenapi import bulk
+from listenapi.models import Recording, Excerpt, Musician, Upload
+from listenapi.jobs import enqueue, enqueue_many
+from listenapi.peaks import PEAK_BITS, peaks_path, resolutions
+from listenapi.response_cache import cached_list
+from listenapi.serializers import RECORDING
+from listenapi.signals import created_in_bulk
+from listenapi.streaming import stream_list, wants_stream
+from listenapi.uploads import url
+from listenapi.versions import conditional
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.parsers import MultiPartParser, FormParser
 
-class UserSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = User
-        fields = ('first_name', 'last_name', 'email')
-
-class MusicianSerializer(serializers.ModelSerializer):
-    """Serializer for Musician info from a recording"""
-    user = UserSerializer(many=False)
-    class Meta:
-        model = Musician
-        fields = ('id', 'bio', 'user')
-
-class ExcerptSerializer(serializers.ModelSerializer):
-    """Serializer for excerpt info from a recording"""
-    musician = MusicianSerializer(many=False)
-    class Meta:
-        model = Excerpt
-        fields = ('id', 'name', 'musician')
-
-class RecordingSerializer(serializers.ModelSerializer):
-    """JSON serializer for recordings"""
-    excerpt = ExcerptSerializer(many=False)
-    class Meta:
-        model = Recording
-        fields = ('id', 'audio', 'excerpt', 'date', 'label')
-        depth = 2
-
-
-class Recordings(ViewSet):
+class Recordings(GenericViewSet):
     """Request handlers for Recordings"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    ordering = ('-date', '-id')
 
     def create(self, request):
         """
@@ -50,7 +33,8 @@ class Recordings(ViewSet):
         @apiHeader {String} Authorization Auth token
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
-        @apiParam {String} audio String of url blob or cloudinary link
+        @apiParam {String} [audio] String of url blob or cloudinary link
+        @apiParam {id} [upload] Id of a complete upload from /uploads, instead of audio
         @apiParam {Number} excerpt_id Excerpt being recorded
         @apiParam {Date} date Date created
         @apiParam {String} label Name of recording
@@ -67,6 +51,12 @@ class Recordings(ViewSet):
         @apiSuccess (200) {Number} recording.excerpt_id Associated excerpt
         @apiSuccess (200) {Date} recording.date Date created
         @apiSuccess (200) {String} recording.label Name of recording
+        @apiSuccess (200) {Number} recording.duration Length in seconds, for uploaded WAV audio
+            once it has been analysed; null until then
+        @apiSuccess (200) {Number} recording.sample_rate Frames per second, for uploaded WAV audio
+        @apiSuccess (200) {Number} recording.channels Channel count, for uploaded WAV audio
+        @apiSuccess (200) {Number} recording.comment_count Comments on the recording
+        @apiSuccess (200) {Number} recording.goal_count Goals on the recording
         @apiSuccessExample {json} Success
             {
                 "id": 1,
@@ -77,12 +67,24 @@ class Recordings(ViewSet):
                     "name": "Mozart 5",
                     "done": False,
                     "musician": 1
-                }
+                },
+                "duration": 42.5,
+                "sample_rate": 44100,
+                "channels": 1
             }
         """
         try:
             new_recording = Recording()
-            new_recording.audio = request.data["audio"]
+
+            if "upload" in request.data:
+                related_upload = Upload.objects.get(
+                    pk=request.data["upload"], musician=request.user.musician,
+                    completed_on__isnull=False)
+                new_recording.upload = related_upload
+                new_recording.audio = url(related_upload)
+            else:
+                new_recording.audio = request.data["audio"]
+
             new_recording.date = request.data["date"]
             new_recording.label = request.data["label"]
 
@@ -91,16 +93,113 @@ class Recordings(ViewSet):
 
             new_recording.save()
 
-            serializer = RecordingSerializer(new_recording, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # peaks and metadata are filled in by a worker shortly afterwards
+            if new_recording.upload is not None:
+                enqueue('listenapi.tasks.analyse_recording', new_recording.id)
+
+            return Response(RECORDING.render_instance(new_recording), status=status.HTTP_201_CREATED)
         
         except Exception as ex:
             return Response({'message': ex.args[0]})
         
 
+    @action(methods=['post'], detail=False)
+    def bulk(self, request):
+        """
+        @api {POST} /recordings/bulk POST several new recordings
+        @apiDescription Creates every valid recording of the array in one transaction.
+            Invalid items are reported and the rest are still created.
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiParam {Object[]} body Array of at most BULK_MAX_ITEMS recordings, each as for POST /recordings
+        @apiParamExample {json} Input
+            [
+                {
+                    "upload": "3f2b8a4e-5c1d-4e8b-9a7f-2d6c0b1e4a59",
+                    "excerpt": 1,
+                    "date": "2020-12-09",
+                    "label": "Mozart 5 take 1"
+                },
+                {
+                    "audio": "urlstring",
+                    "excerpt": 1,
+                    "date": "2020-12-09",
+                    "label": "Mozart 5 take 2"
+                }
+            ]
+        @apiSuccess (200) {Object[]} results One per item, in request order
+        @apiSuccess (200) {Number} results.index Position of the item in the request
+        @apiSuccess (200) {Number} results.status 201 if the item was created, 400 if not
+        @apiSuccess (200) {Object} [results.recording] Created recording, as from POST /recordings
+        @apiSuccess (200) {String} [results.message] Why the item was not created
+        @apiSuccessExample {json} Success
+            {
+                "results": [
+                    {
+                        "index": 0,
+                        "status": 201,
+                        "recording": {
+                            "id": 1,
+                            "audio": "/media/audio/9c/9c1f...e2.wav",
+                            "excerpt": {...},
+                            "date": "2020-12-09",
+                            "label": "Mozart 5 take 1",
+                            "duration": null,
+                            "sample_rate": null,
+                            "channels": null
+                        }
+                    },
+                    {
+                        "index": 1,
+                        "status": 201,
+                        "recording": {...}
+                    }
+                ]
+            }
+        """
+        items = bulk.items_of(request)
+
+        # one query per related table for the whole array
+        excerpts = Excerpt.objects.select_related('musician__user').in_bulk(bulk.ids_of(items, 'excerpt'))
+        uploads = Upload.objects.filter(
+            musician=request.user.musician, completed_on__isnull=False
+        ).in_bulk(bulk.ids_of(items, 'upload', UUID))
+
+        entries = []
+        for item in items:
+            try:
+                new_recording = Recording(
+                    date=bulk.field(item, 'date'),
+                    label=bulk.field(item, 'label'),
+                    excerpt=bulk.related(item, 'excerpt', excerpts)
+                )
+                if "upload" in item:
+                    new_recording.upload = bulk.related(item, 'upload', uploads, UUID)
+                    new_recording.audio = url(new_recording.upload)
+                else:
+                    new_recording.audio = bulk.field(item, 'audio')
+                entries.append(new_recording)
+            except bulk.ItemError as ex:
+                entries.append(ex)
+
+        new_recordings = [entry for entry in entries if isinstance(entry, Recording)]
+        with transaction.atomic():
+            bulk.insert(Recording, new_recordings)
+            created_in_bulk(Recording, new_recordings)
+            # peaks and metadata are filled in by a worker shortly afterwards
+            enqueue_many('listenapi.tasks.analyse_recording',
+                         [(new_recording.id,) for new_recording in new_recordings
+                          if new_recording.upload is not None])
+
+        return Response({'results': bulk.results(entries, 'recording', RECORDING.render_instance)})
+
+    @conditional(Recording, Excerpt, Musician, User)
     def retrieve(self, request, pk=None):
         """
         @api {GET} /recordings/:id GET recording
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (label,excerpt.name)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
         @apiParam {id} id Recording Id
         @apiSuccess (200) {Object} recording Created recording
         @apiSuccess (200) {id} recording.id Recording Id
@@ -108,6 +207,8 @@ class Recordings(ViewSet):
         @apiSuccess (200) {Number} recording.excerpt_id Associated excerpt
         @apiSuccess (200) {Date} recording.date Date created
         @apiSuccess (200) {String} recording.label Name of recording
+        @apiSuccess (200) {Number} recording.comment_count Comments on the recording
+        @apiSuccess (200) {Number} recording.goal_count Goals on the recording
         @apiSuccessExample {json} Success
             {
                 "id": 1,
@@ -124,9 +225,9 @@ class Recordings(ViewSet):
         """
 
         try:
-            recording = Recording.objects.get(pk=pk)
-            serializer = RecordingSerializer(recording, context={'request': request})
-            return Response(serializer.data)
+            projection = RECORDING.for_request(request)
+            recording = projection.values(Recording.objects.all()).get(pk=pk)
+            return Response(projection.render(recording))
         except Recording.DoesNotExist as ex:
             return HttpResponseServerError(ex, status = status.HTTP_404_NOT_FOUND)
 
@@ -174,52 +275,103 @@ class Recordings(ViewSet):
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    @conditional(Recording, Excerpt, Musician, User)
+    @cached_list('musician', 'musician')
     def list(self, request):
         """
         @api {GET} /recordings GET all recordings
-        @apiSuccess (200) {Object[]} recordings Array of recordings
+        @apiParam {String} [fields] Comma-separated fields to return, dotted for nested ones (label,excerpt.name)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids
+        @apiParam {Number} [excerpt] Only recordings of this excerpt
+        @apiParam {Number} [musician] Only recordings of this musician's excerpts
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next/previous link
+        @apiParam {Number} [page_size=10] Recordings per page, at most MAX_PAGE_SIZE
+        @apiParam {Number} [stream] 1 to receive every matching recording as one streamed JSON array instead of a page
+        @apiSuccess (200) {String} next Link to the next (older) page, or null
+        @apiSuccess (200) {String} previous Link to the previous (newer) page, or null
+        @apiSuccess (200) {Object[]} results Array of recordings, newest first
         @apiSuccessExample {json} Success
-            [
-                {
-                "id": 1,
-                "audio": "urlstring",
-                "date": "2020-12-09"
-                "label": "Mozart 5 take 1",
-                "excerpt": {
-                    "name": "Mozart 5",
-                    "done": False,
-                    "musician": 1
-                }
-            
-            ]
+            {
+                "next": "http://localhost:8000/recordings?cursor=eyJwIjpbIjIwMjAtMTItMDkiLDFdLCJyIjowfQ%3D%3D",
+                "previous": null,
+                "results": [
+                    {
+                    "id": 1,
+                    "audio": "urlstring",
+                    "date": "2020-12-09"
+                    "label": "Mozart 5 take 1",
+                    "excerpt": {
+                        "name": "Mozart 5",
+                        "done": False,
+                        "musician": 1
+                    }
+                ]
+            }
         """
-        recordings = Recording.objects.all()
-        excerpts = Excerpt.objects.all()
+        # One flat query across every join the representation needs;
+        # pagination orders it newest first
+        projection = RECORDING.for_request(request, self)
+        recordings = projection.values(Recording.objects.all())
 
         # Support filtering
         excerpt = self.request.query_params.get('excerpt', None)
         musician = self.request.query_params.get('musician', None)
-        
 
         if excerpt is not None:
-            recordings = recordings.filter(excerpt_id = excerpt)
+            recordings = recordings.filter(excerpt_id=excerpt)
 
         if musician is not None:
-            musician = Musician.objects.get(pk=musician)
-            excerpts = excerpts.filter(musician=musician) 
-            recordings = []
+            recordings = recordings.filter(excerpt__musician_id=musician)
 
-            for excerpt in excerpts:
-                recordings_list = Recording.objects.filter(excerpt=excerpt)
+        if wants_stream(request):
+            return stream_list(self, recordings, projection.render)
 
-                for recording in recordings_list:
-                    recordings.append(recording)
-     
+        page = self.paginate_queryset(recordings)
+        return self.get_paginated_response(projection.render_many(page))
 
-        serializer = RecordingSerializer(
-            reversed(recordings), many=True, context={'request': request})
-        return Response(serializer.data)
+    @action(methods=['get'], detail=True)
+    def peaks(self, request, pk=None):
+        """
+        @api {GET} /recordings/:id/peaks GET waveform peaks
+        @apiDescription Binary min/max envelope of an uploaded recording, for
+            drawing its waveform without downloading the audio. The body is
+            little-endian signed integer (min, max) pairs, one pair per
+            `resolution` frames with all channels folded together, scaled so
+            full scale is 127 (8 bits) or 32767 (16 bits).
+        @apiParam {id} id Recording Id
+        @apiParam {Number} [resolution] Frames per peak, one of PEAK_RESOLUTIONS; the coarsest by default
+        @apiParam {Number} [bits=16] 8 or 16 bits per value
+        @apiSuccess (200) {Binary} peaks application/octet-stream; the resolution and
+            width are echoed in Peaks-Resolution and Peaks-Bits headers
+        @apiError (404) {Object} message The recording has no uploaded WAV audio to draw
+        """
+        try:
+            resolution = int(request.query_params.get('resolution', resolutions()[-1]))
+            bits = int(request.query_params.get('bits', 16))
+        except ValueError:
+            resolution = bits = None
 
-        
+        if resolution not in resolutions() or bits not in PEAK_BITS:
+            return Response(
+                {'message': f'resolution must be one of {list(resolutions())} and bits one of {list(PEAK_BITS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            recording = Recording.objects.select_related('upload').get(pk=pk)
+        except Recording.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        if recording.upload is None or recording.duration is None:
+            return Response({'message': 'No peaks for this recording'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            peaks = open(peaks_path(recording.upload, resolution, bits), 'rb')
+        except FileNotFoundError:
+            # analysed before this resolution was configured, or the files were lost
+            return Response({'message': 'No peaks for this recording'}, status=status.HTTP_404_NOT_FOUND)
 
-    
\ No newline at end of file
+        response = FileResponse(peaks, content_type='application/octet-stream')
+        response['Peaks-Resolution'] = resolution
+        response['Peaks-Bits'] = bits
+        return response
@@ -0,0 +1,100 @@
+"""View module for full-text search"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework.viewsets import GenericViewSet
+from rest_framework.response import Response
+from rest_framework.pagination import _positive_int
+from rest_framework import status
+from listenapi import search
+from listenapi.models import Category, Comment, Excerpt, Goal, Musician, Recording, SearchEntry
+from listenapi.serializers import SEARCH_RESULT, viewer_is
+from listenapi.versions import conditional
+
+# kind: lookup of the viewer's musician for created_by_current_user
+RESULTS = {
+    SearchEntry.EXCERPT: 'musician_id',
+    SearchEntry.RECORDING: None,
+    SearchEntry.COMMENT: 'author_id',
+    SearchEntry.GOAL: None,
+}
+
+
+class Search(GenericViewSet):
+    """Request handlers for search"""
+
+    @conditional(Excerpt, Recording, Comment, Goal, Category, Musician, User)
+    def list(self, request):
+        """
+        @api {GET} /search GET excerpts, recordings, comments and goals matching words
+        @apiDescription Every word must match, as a whole word or a prefix, an
+            excerpt's name, a recording's label, a comment or a goal and its
+            action. Best matches come first.
+        @apiParam {String} q Words to search for
+        @apiParam {String} [type] Comma-separated kinds to search: excerpt, recording, comment, goal
+        @apiParam {Number} [musician] Only what appears on this musician's excerpts and recordings
+        @apiParam {Number} [page_size=10] Results to return, at most MAX_PAGE_SIZE
+        @apiParam {Number} [offset=0] Results to skip, for the next page
+        @apiParam {String} [fields] Comma-separated fields of each result to return, under the kind for
+            the match (rank,comment.content,recording.label)
+        @apiParam {String} [expand] Comma-separated relations to nest rather than return as ids (comment.author)
+        @apiSuccess (200) {Object[]} results Matches, best first
+        @apiSuccess (200) {String} results.type excerpt, recording, comment or goal
+        @apiSuccess (200) {Number} results.rank Relevance; higher is better
+        @apiSuccess (200) {Object} results.excerpt|recording|comment|goal The match, as from its own endpoint
+        @apiSuccessExample {json} Success
+            {
+                "results": [
+                    {
+                        "type": "comment",
+                        "rank": 4.27,
+                        "comment": {
+                            "id": 12,
+                            "author": {...},
+                            "recording": {...},
+                            "date": "2020-12-09",
+                            "content": "More bow speed in the crescendo",
+                            "created_by_current_user": false
+                        }
+                    }
+                ]
+            }
+        """
+        text = request.query_params.get('q', '')
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        musician = request.query_params.get('musician')
+
+        try:
+            if any(kind not in RESULTS for kind in kinds):
+                raise ValueError(f'type must be among {", ".join(RESULTS)}')
+            try:
+                limit = _positive_int(request.query_params.get('page_size', 10), strict=True,
+                                      cutoff=getattr(settings, 'MAX_PAGE_SIZE', 100))
+                offset = _positive_int(request.query_params.get('offset', 0))
+            except ValueError:
+                # _positive_int's own errors carry no message
+                raise ValueError('page_size must be a positive number and offset zero or more')
+            musician = None if musician is None else int(musician)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = SEARCH_RESULT.for_request(request)
+        parts = dict(result.fields)
+        hits = search.search(text, kinds, musician, limit, offset)
+
+        # one query per kind that matched and is rendered as more than its id
+        found = {(kind, pk): pk for kind, pk, _ in hits if parts.get(kind) is None}
+        for kind in {kind for kind, _, _ in hits if parts.get(kind) is not None}:
+            projection, author = parts[kind].selecting('id'), RESULTS[kind]
+            model = search.SOURCES[kind][0]
+            rows = model.objects.filter(pk__in=[pk for hit_kind, pk, _ in hits if hit_kind == kind])
+            if author is not None:
+                rows = rows.annotate(created_by_current_user=viewer_is(request, author))
+            for row in projection.values(rows):
+                found[kind, row['id']] = projection.render(row)
+
+        results = []
+        for kind, pk, rank in hits:
+            if (kind, pk) in found:
+                hit = {'type': kind, 'rank': rank, kind: found[kind, pk]}
+                results.append({name: hit[name] for name, _ in result.fields if name in hit})
+        return Response({'results': results})
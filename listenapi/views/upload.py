@@ -0,0 +1,119 @@
+"""View module for handling requests about audio uploads"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from rest_framework.viewsets import GenericViewSet
+from rest_framework.response import Response
+from rest_framework import status
+from listenapi.models import Upload
+from listenapi.serializers import UPLOAD
+from listenapi.uploads import ChunkConflict, finish, receive_chunk
+
+class Uploads(GenericViewSet):
+    """Request handlers for chunked audio uploads"""
+
+    def create(self, request):
+        """
+        @api {POST} /uploads POST new upload session
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiParam {String} filename Name of the audio file, for its extension
+        @apiParam {Number} size Size of the whole file in bytes, at most UPLOAD_MAX_SIZE
+        @apiParamExample {json} Input
+            {
+                "filename": "mozart5-take1.wav",
+                "size": 5292044
+            }
+        @apiSuccess (201) {Object} upload Created upload session
+        @apiSuccessExample {json} Success
+            {
+                "id": "1f0e5c9a-3b8e-4f4e-9a55-0b1f6c2d7e11",
+                "filename": "mozart5-take1.wav",
+                "size": 5292044,
+                "received": 0,
+                "complete": false,
+                "sha256": ""
+            }
+        """
+        try:
+            size = int(request.data["size"])
+            if not 0 < size <= getattr(settings, 'UPLOAD_MAX_SIZE', 200 * 1024 * 1024):
+                return Response({'message': 'Upload size out of range'}, status=status.HTTP_400_BAD_REQUEST)
+
+            new_upload = Upload()
+            new_upload.musician = request.user.musician
+            new_upload.filename = request.data["filename"]
+            new_upload.size = size
+
+            new_upload.save()
+
+            return Response(UPLOAD.render_instance(new_upload), status=status.HTTP_201_CREATED)
+
+        except Exception as ex:
+            return Response({'message': ex.args[0]})
+
+    def retrieve(self, request, pk=None):
+        """
+        @api {GET} /uploads/:id GET upload progress
+        @apiParam {String} [fields] Comma-separated fields to return (received,complete)
+        @apiDescription After a dropped connection, resume by sending the
+            next chunk at `received`.
+        @apiParam {id} id Upload Id
+        @apiSuccess (200) {Object} upload The upload session
+        """
+        try:
+            upload = self.get_upload(request, pk)
+            return Response(UPLOAD.for_request(request).render_instance(upload))
+        except (Upload.DoesNotExist, ValidationError):
+            return Response({'message': 'Upload does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+    def update(self, request, pk=None):
+        """
+        @api {PUT} /uploads/:id PUT a chunk of the file
+        @apiHeader {String} Authorization Auth token
+        @apiHeader {Number} Upload-Offset Position of the chunk in the file; must equal `received`
+        @apiHeader {Number} Content-Length Size of the chunk
+        @apiHeaderExample {String} Upload-Offset
+            1048576
+        @apiParam {id} id Upload Id
+        @apiParam {Binary} body The chunk's bytes, sent as the raw request body
+        @apiSuccess (200) {Object} upload The upload session; complete, with its sha256,
+            once the last chunk is in
+        @apiError (409) {Object} upload The chunk was not at `received`, another chunk
+            is being written, or the upload is already complete; nothing was written
+        """
+        try:
+            upload = self.get_upload(request, pk)
+        except (Upload.DoesNotExist, ValidationError):
+            return Response({'message': 'Upload does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'message': 'Upload-Offset and Content-Length are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if upload.complete or offset != upload.received:
+            return Response(UPLOAD.render_instance(upload), status=status.HTTP_409_CONFLICT)
+
+        if length <= 0 or offset + length > upload.size:
+            return Response({'message': 'Chunk does not fit the upload'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # read from the request stream, never request.data, so the chunk goes
+        # straight to disk
+        try:
+            received = receive_chunk(upload, offset, request.stream, length)
+        except ChunkConflict:
+            upload.refresh_from_db()
+            return Response(UPLOAD.render_instance(upload), status=status.HTTP_409_CONFLICT)
+
+        # only the request whose chunk completed the upload gets here with every byte in
+        if received == upload.size:
+            finish(upload)
+
+        return Response(UPLOAD.render_instance(upload))
+
+    def get_upload(self, request, pk):
+        """The current musician's upload `pk`"""
+        return Upload.objects.get(pk=pk, musician=request.user.musician)
@@ -0,0 +1,16 @@
+"""Entry points for the processes `manage.py runworker` runs jobs in
+
+A spawned process imports this module before Django is set up, so it must
+not import models at import time.
+"""
+import django
+
+
+def setup():
+    """Pool initializer: load settings and apps in the new interpreter"""
+    django.setup()
+
+
+def run(job_id):
+    from listenapi.jobs import execute
+    execute(job_id)
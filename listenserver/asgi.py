@@ -2,6 +2,9 @@
 ASGI config for listenserver project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn listenserver.asgi:application``)
+so async views such as login, register and /async/recordings run on the event
+loop instead of tying up a worker thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
@@ -10,8 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -55,20 +60,71 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'listenapi.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'listenapi.pagination.KeysetPagination',
     'PAGE_SIZE': 10
 }
 
+# Upper bound for the ?page_size= query parameter on list endpoints
+MAX_PAGE_SIZE = 100
+
+# Per-process cache of authenticated tokens: how many, and for how many seconds
+TOKEN_CACHE_SIZE = 1024
+TOKEN_CACHE_TTL = 300
+
+# Threads hashing passwords for the async login and register views
+PASSWORD_HASHER_THREADS = 4
+
+# Rows fetched per round trip when a list endpoint streams (?stream=1)
+STREAM_CHUNK_SIZE = 500
+
+# Cached list responses (listenapi.response_cache). Local memory is per
+# process: run several workers against a shared backend such as
+# 'django.core.cache.backends.filebased.FileBasedCache' so a write
+# invalidates every worker's entries
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'listen',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Seconds a cached list is kept, and the longest a request waits for
+# another request building the same list
+RESPONSE_CACHE_TIMEOUT = 300
+RESPONSE_CACHE_BUILD_WAIT = 5
+
+# Musicians to suggest following, how many of the most recently followed
+# musicians they are drawn from, and how long a ranking is cached
+SUGGESTION_LIMIT = 10
+SUGGESTION_SOURCES = 200
+SUGGESTION_TIMEOUT = 3600
+
+# Background jobs (manage.py runworker): worker processes, seconds between
+# polls when idle, seconds a claimed job may run before another worker
+# takes it over, and tries before a job is marked failed, backing off from
+# JOB_RETRY_DELAY seconds and doubling up to JOB_RETRY_MAX_DELAY
+JOB_WORKER_PROCESSES = 2
+JOB_POLL_INTERVAL = 1.0
+JOB_LEASE = 600
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_RETRY_MAX_DELAY = 3600
+
 CORS_ORIGIN_WHITELIST = (
     'http://localhost:3000',
     'http://127.0.0.1:3000'
 )
 
+# Clients that do not keep cookies read X-Primary-Until and send it back
+CORS_ALLOW_HEADERS = default_headers + ('x-primary-until',)
+CORS_EXPOSE_HEADERS = ['X-Primary-Until']
+
 ROOT_URLCONF = 'listenserver.urls'
 
 TEMPLATES = [
@@ -93,11 +149,82 @@ WSGI_APPLICATION = 'listenserver.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# SQLite in db.sqlite3 unless DATABASE_ENGINE=postgresql, which reads
+# DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST and
+# DATABASE_PORT. DATABASE_CONN_MAX_AGE is how many seconds a connection is
+# kept for later requests (0 opens one per request); a kept connection is
+# checked before it is reused. DATABASE_POOL_SIZE pools PostgreSQL
+# connections instead, which Django supports from 5.1.
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 0))
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'listen'),
+            'USER': os.environ.get('DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', ''),
+            'PORT': os.environ.get('DATABASE_PORT', ''),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
+    if DATABASE_POOL_SIZE:
+        if django.VERSION < (5, 1):
+            raise ImproperlyConfigured(
+                'DATABASE_POOL_SIZE needs Django 5.1 or later; use DATABASE_CONN_MAX_AGE, '
+                'with a pooler such as PgBouncer in front of PostgreSQL')
+        # a pooled connection goes back to the pool after each request
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {'min_size': 1, 'max_size': DATABASE_POOL_SIZE}
+elif DATABASE_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            # Django's backend with 5.1's transaction_mode
+            'ENGINE': 'listenapi.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # transactions take the write lock when they begin, so they
+            # wait out busy_timeout rather than fail if another commits first
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'DATABASE_ENGINE must be sqlite or postgresql, not {DATABASE_ENGINE!r}')
+
+# Read replicas (listenapi.replicas): DATABASE_REPLICAS lists, comma
+# separated, the SQLite files or PostgreSQL hosts that replication keeps in
+# step with the primary. Requests read from them, except for
+# REPLICA_PIN_SECONDS after the client last wrote
+REPLICA_DATABASES = []
+for number, source in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    replica = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    replica['HOST' if DATABASE_ENGINE == 'postgresql' else 'NAME'] = source.strip()
+    DATABASES[f'replica{number}'] = replica
+    REPLICA_DATABASES.append(f'replica{number}')
+
+REPLICA_PIN_SECONDS = 5
+
+DATABASE_ROUTERS = ['listenapi.replicas.ReplicaRouter']
+
+# Set on every new SQLite connection (listenapi.database): write-ahead
+# logging so reads and the one write run side by side, fsync only at WAL
+# checkpoints (safe against a crashed process, though the last commits can
+# be lost if the machine loses power), milliseconds to wait for the write
+# lock before "database is locked", and bytes of the file to read through
+# a memory map
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
 }
 
 
@@ -121,6 +248,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'listenapi.replicas.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -148,3 +276,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Uploaded audio, stored under its SHA-256 below MEDIA_ROOT/audio
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Most items one POST to a /bulk endpoint may create
+BULK_MAX_ITEMS = 100
+
+# Largest audio file, in bytes, a chunked upload may declare
+UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+
+# Bytes copied from the request to disk per read while receiving a chunk
+UPLOAD_BLOCK_SIZE = 64 * 1024
+
+# Frames per waveform peak stored for each uploaded recording; each must be a
+# multiple of the smallest
+PEAK_RESOLUTIONS = (256, 1024, 4096, 16384)
@@ -13,11 +13,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 from django.conf.urls import url, include
-from listenapi.views import register_user, login_user
-from listenapi.views import Categories, Comments, Connections, Excerpts, Goals, Musicians, Recordings, CurrentUser
+from listenapi.views import register_user, login_user, list_recordings, retrieve_recording
+from listenapi.views import Categories, Comments, Connections, Excerpts, Feed, Goals, Musicians, Recordings, Search, Uploads, CurrentUser
 from rest_framework import routers
 
 router = routers.DefaultRouter(trailing_slash=False)
@@ -26,14 +28,19 @@ router.register(r'comments', Comments, 'comment')
 router.register(r'connections', Connections, 'connection')
 router.register(r'currentuser', CurrentUser, 'musician')
 router.register(r'excerpts', Excerpts, 'excerpt')
+router.register(r'feed', Feed, 'feed')
 router.register(r'goals', Goals, 'goal')
 router.register(r'musicians', Musicians, 'musician')
 router.register(r'recordings', Recordings, 'recording')
+router.register(r'search', Search, 'search')
+router.register(r'uploads', Uploads, 'upload')
 
 urlpatterns = [
     # path('admin/', admin.site.urls), #not needed?
     path('', include(router.urls)),
     path('register', register_user),
     path('login', login_user),
+    path('async/recordings', list_recordings),
+    path('async/recordings/<int:pk>', retrieve_recording),
     path('api-auth', include('rest_framework.urls', namespace='rest_framework'))
-]
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,6 @@ python manage.py loaddata comments
 python manage.py loaddata connections
 python manage.py loaddata goals
 
+python manage.py reconcile_counts
+python manage.py rebuild_practice_stats
+python manage.py rebuild_search_index